@@ -0,0 +1,77 @@
+"""Import time budget of the API module
+
+Imports the module in fresh interpreters under `python -X importtime`, prints the slowest
+imports of the fastest run, and exits with status 1 if the cold import exceeds the budget
+or loads one of the frameworks that should only be imported by the models needing them.
+Meant to run in CI so that slow imports do not creep back into the startup path.
+
+Usage: python -m benchmarks.import_time [--module quizachu.api.fast] [--budget-ms 1500]
+                                        [--repeat 3] [--top 15]
+"""
+import argparse
+import json
+import subprocess
+import sys
+
+# Frameworks loaded on first use of a model, never by importing the API
+DEFERRED_MODULES = ["tensorflow", "transformers", "torch", "onnxruntime", "optimum", "pandas", "google.cloud.storage"]
+
+CHILD = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(json.dumps({{"seconds": elapsed, "loaded": [m for m in {deferred!r} if m in sys.modules]}}))
+"""
+
+
+def measure_import(module, deferred=DEFERRED_MODULES):
+    """Returns the import time in seconds, the deferred modules it loaded and the importtime report"""
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", CHILD.format(module=module, deferred=deferred)],
+                            capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"Importing {module} failed:\n{result.stderr[-2000:]}")
+    measurement = json.loads(result.stdout.strip().splitlines()[-1])
+    return measurement["seconds"], measurement["loaded"], parse_importtime(result.stderr)
+
+def parse_importtime(report):
+    """Returns (module, self us, cumulative us) for every line of a -X importtime report"""
+    imports = []
+    for line in report.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        if not self_us.strip().isdigit():
+            continue
+        imports.append((name.strip(), int(self_us), int(cumulative_us)))
+    return imports
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--module", default="quizachu.api.fast")
+    parser.add_argument("--budget-ms", type=float, default=1500)
+    parser.add_argument("--repeat", type=int, default=3, help="cold imports to run, the fastest one is kept")
+    parser.add_argument("--top", type=int, default=15, help="number of slowest imports to list")
+    args = parser.parse_args()
+
+    runs = [measure_import(args.module) for _ in range(args.repeat)]
+    seconds, loaded, imports = min(runs, key=lambda run: run[0])
+
+    print(f"{'self (ms)':>10} {'cumulative (ms)':>16}  module")
+    for name, self_us, cumulative_us in sorted(imports, key=lambda x: -x[1])[:args.top]:
+        print(f"{self_us / 1000:>10.1f} {cumulative_us / 1000:>16.1f}  {name}")
+    print(f"\nImport of {args.module}: {seconds * 1000:.0f} ms (budget {args.budget_ms:.0f} ms)")
+
+    failed = False
+    if seconds * 1000 > args.budget_ms:
+        print(f"❌ Import time over budget by {seconds * 1000 - args.budget_ms:.0f} ms")
+        failed = True
+    if loaded:
+        print(f"❌ Importing {args.module} loads {', '.join(loaded)}, which should only be imported by the models using them")
+        failed = True
+    if failed:
+        sys.exit(1)
+    print("✅ Import time within budget")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,254 @@
+"""End to end benchmark of the generate -> answer -> select -> score pipeline
+
+Builds documents of several sizes from the cleaned articles in
+notebooks/questions_for_training/text_data, runs each one through the same stages as
+/generate-questions-and-answers followed by answer scoring, and reports per stage
+p50/p95 latency, throughput and peak resident memory.
+
+    generate  questions for every chunk planned by `plan_question_generation`
+    answer    `answer_questions_with_confidence` on the whole document
+    select    `select_top_n_answered_questions` on the answered candidates
+    score     `check_answers_similarity` of each selected answer against a rephrasing
+
+With --chunk-groups, each document is also run through generate and answer as the API
+pipelines them: chunk groups are generated on a background thread while the questions of
+the previous group are answered. One `pipe:N` stage is reported per group size N
+(0, reported as `pipe:auto`, is the default size of `pipeline_chunk_group`).
+
+With --tiny, randomly initialized miniature models are built from configs instead of
+loading the real ones, so the benchmark runs offline (e.g. in CI).
+
+Usage: python -m benchmarks.pipeline [--tiny] [--sizes 150 450 1000 2000] [--docs 3]
+                                     [--repeat 1] [--chunk-groups 0 8] [--output results.json]
+"""
+from quizachu.chunking import plan_question_generation, pipeline_chunk_group
+from quizachu.params import PIPELINE_QUEUE_SIZE
+from quizachu.generate.model import generate_questions_batch
+from quizachu.answer.model import answer_questions_with_confidence, select_top_n_answered_questions
+from quizachu.score.model import check_answers_similarity
+from quizachu.utils import get_rss_mb
+from pathlib import Path
+
+import argparse
+import contextlib
+import io
+import json
+import platform
+import queue
+import threading
+import time
+import numpy as np
+
+TEXT_DATA = Path(__file__).resolve().parents[1] / "notebooks" / "questions_for_training" / "text_data"
+STAGES = ["generate", "answer", "select", "score"]
+
+
+def load_articles(text_data=TEXT_DATA):
+    articles = []
+    for path in sorted(Path(text_data).glob("*.clean")):
+        text = path.read_text(encoding="utf-8", errors="ignore")
+        # Skip the title line and collapse the paragraph breaks
+        words = " ".join(text.split("\n", 1)[-1].split())
+        if words:
+            articles.append(words)
+    return articles
+
+def make_corpus(articles, sizes, docs_per_size):
+    """Returns {size: [documents]} where each document has `size` words, taken from consecutive articles"""
+    words = " ".join(articles).split()
+    corpus = {}
+    offset = 0
+    for size in sizes:
+        documents = []
+        for _ in range(docs_per_size):
+            if offset + size > len(words):
+                offset = 0
+            documents.append(" ".join(words[offset:offset + size]))
+            offset += size
+        corpus[size] = documents
+    return corpus
+
+
+class PeakMemory:
+    """Samples the resident set size on a background thread while the block runs"""
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.peak = 0
+        self.stopped = threading.Event()
+
+    def _sample(self):
+        while not self.stopped.wait(self.interval):
+            self.peak = max(self.peak, get_rss_mb())
+
+    def __enter__(self):
+        self.peak = get_rss_mb()
+        self.thread = threading.Thread(target=self._sample, daemon=True)
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stopped.set()
+        self.thread.join()
+        self.peak = max(self.peak, get_rss_mb())
+
+
+class StageTimer:
+    """Collects latency, item counts and peak memory of every call to each stage"""
+
+    def __init__(self):
+        self.records = {stage: [] for stage in STAGES}
+
+    @contextlib.contextmanager
+    def measure(self, stage, n_items):
+        with PeakMemory() as memory:
+            start = time.perf_counter()
+            yield
+            elapsed = time.perf_counter() - start
+        self.records.setdefault(stage, []).append((elapsed, n_items, memory.peak))
+
+    def summary(self):
+        summary = {}
+        for stage, records in self.records.items():
+            if not records:
+                continue
+            latencies = np.array([elapsed for elapsed, _, _ in records]) * 1000
+            total_time = float(latencies.sum()) / 1000
+            n_items = sum(items for _, items, _ in records)
+            summary[stage] = {"calls": len(records),
+                              "p50_ms": float(np.percentile(latencies, 50)),
+                              "p95_ms": float(np.percentile(latencies, 95)),
+                              "mean_ms": float(latencies.mean()),
+                              "items": n_items,
+                              "items_per_s": n_items / total_time if total_time else None,
+                              "docs_per_s": len(records) / total_time if total_time else None,
+                              "peak_rss_mb": max(peak for _, _, peak in records)}
+        return summary
+
+
+def load_models(tiny=False, articles=None):
+    """Returns the generate model and tokenizer, question answerer, score model, score tokenizer
+    and the lengths score batches are padded to"""
+    if tiny:
+        from benchmarks.tiny_models import (create_tiny_tokenizer, create_tiny_generate_model,
+                                            create_tiny_question_answerer, create_tiny_score_model)
+        from quizachu.score.model import fit_length_buckets
+        tokenizer = create_tiny_tokenizer(articles)
+        score_model, length_buckets = fit_length_buckets(create_tiny_score_model(tokenizer), tokenizer)
+        return (create_tiny_generate_model(tokenizer), tokenizer, create_tiny_question_answerer(tokenizer),
+                score_model, tokenizer, length_buckets)
+
+    from quizachu.generate.model import create_generate_model, create_generate_tokenizer
+    from quizachu.answer.model import create_question_answerer
+    from quizachu.score.model import AnswerScorer
+    scorer = AnswerScorer().load()
+    return (create_generate_model(), create_generate_tokenizer(), create_question_answerer(),
+            scorer.model, scorer.tokenizer, scorer.length_buckets)
+
+def run_document(models, document, timer):
+    generate_model, generate_tokenizer, question_answerer, score_model, score_tokenizer, length_buckets = models
+    n_questions, contexts, questions_per_context, _ = plan_question_generation(generate_tokenizer, document)
+
+    with timer.measure("generate", len(contexts)):
+        questions = [question
+                     for context_questions in generate_questions_batch(generate_model, generate_tokenizer, contexts, questions_per_context)
+                     for question in context_questions]
+
+    with timer.measure("answer", len(questions)):
+        questions_answers = answer_questions_with_confidence(question_answerer, document, questions)
+
+    with timer.measure("select", len(questions_answers)):
+        selected = select_top_n_answered_questions(questions_answers, n=n_questions)
+
+    # Score each golden answer against a rephrased user answer, as /score-answers would
+    pairs = [(answer, f"I think it is {answer}") for answer in selected["answer"]]
+    with timer.measure("score", len(pairs)):
+        check_answers_similarity(score_model, pairs, tokenizer=score_tokenizer, length_buckets=length_buckets)
+
+def run_pipelined(models, document, timer, chunk_group):
+    """Generates and answers the questions of `document` as `generate_and_answer_questions` does"""
+    generate_model, generate_tokenizer, question_answerer = models[:3]
+    _, contexts, questions_per_context, _ = plan_question_generation(generate_tokenizer, document)
+    groups = queue.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+
+    def produce():
+        try:
+            for start in range(0, len(contexts), group_size):
+                questions = generate_questions_batch(generate_model, generate_tokenizer, contexts[start:start + group_size],
+                                                     questions_per_context)
+                groups.put([question for context_questions in questions for question in context_questions if question])
+            groups.put(None)
+        except Exception as e:
+            groups.put(e)
+
+    group_size = pipeline_chunk_group(len(contexts), chunk_group)
+    stage = f"pipe:{chunk_group or 'auto'}"
+    with timer.measure(stage, len(contexts)):
+        producer = threading.Thread(target=produce, daemon=True)
+        producer.start()
+        while True:
+            questions = groups.get()
+            if questions is None:
+                break
+            if isinstance(questions, Exception):
+                raise questions
+            answer_questions_with_confidence(question_answerer, document, questions)
+        producer.join()
+
+def run_benchmark(models, corpus, repeat=1, chunk_groups=()):
+    results = {}
+    for size, documents in corpus.items():
+        timer = StageTimer()
+        for _ in range(repeat):
+            for document in documents:
+                run_document(models, document, timer)
+                for chunk_group in chunk_groups:
+                    run_pipelined(models, document, timer, chunk_group)
+        results[size] = timer.summary()
+    return results
+
+def print_results(results):
+    print(f"{'words':>6} {'stage':>9} {'p50 (ms)':>10} {'p95 (ms)':>10} {'items/s':>9} {'docs/s':>8} {'peak RSS (MB)':>14}")
+    for size, summary in results.items():
+        for stage, stats in summary.items():
+            print(f"{size:>6} {stage:>9} {stats['p50_ms']:>10.1f} {stats['p95_ms']:>10.1f} "
+                  f"{stats['items_per_s'] or 0:>9.1f} {stats['docs_per_s'] or 0:>8.2f} {stats['peak_rss_mb']:>14.0f}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tiny", action="store_true", help="use randomly initialized miniature models (offline)")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[150, 450, 1000, 2000], help="document sizes in words")
+    parser.add_argument("--docs", type=int, default=3, help="documents per size")
+    parser.add_argument("--repeat", type=int, default=1, help="passes over the corpus")
+    parser.add_argument("--chunk-groups", type=int, nargs="*", default=[],
+                        help="also run generate and answer pipelined with these chunk group sizes (0 for the default)")
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    args = parser.parse_args()
+
+    articles = load_articles()
+    corpus = make_corpus(articles, args.sizes, args.docs)
+
+    print(f"Loading {'tiny' if args.tiny else 'real'} models...")
+    start = time.perf_counter()
+    models = load_models(args.tiny, articles)
+    load_time = time.perf_counter() - start
+    print(f"✅ Models loaded in {load_time:.1f}s ({get_rss_mb():.0f} MB resident)")
+
+    # One untimed pass on the smallest document, so first call costs (graph tracing, allocations) are excluded
+    with contextlib.redirect_stdout(io.StringIO()):
+        run_document(models, corpus[min(args.sizes)][0], StageTimer())
+        results = run_benchmark(models, corpus, args.repeat, args.chunk_groups)
+    print_results(results)
+
+    if args.output:
+        report = {"mode": "tiny" if args.tiny else "real",
+                  "sizes": args.sizes, "docs_per_size": args.docs, "repeat": args.repeat,
+                  "chunk_groups": args.chunk_groups,
+                  "python": platform.python_version(), "machine": platform.machine(),
+                  "model_load_s": load_time,
+                  "results": {str(size): summary for size, summary in results.items()}}
+        Path(args.output).write_text(json.dumps(report, indent=2))
+        print(f"✅ Results written to {args.output}")
+
+if __name__ == "__main__":
+    main()
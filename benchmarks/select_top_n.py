@@ -0,0 +1,64 @@
+"""Micro-benchmark of select_top_n_answered_questions
+
+Compares the vectorized duplicate answer cap against the previous iterrows/drop loop
+on random candidates, checks that both select the same rows, and prints timings.
+
+Usage: python -m benchmarks.select_top_n [--sizes 10 100 1000 10000] [--repeat 5]
+"""
+from quizachu.answer.model import select_top_n_answered_questions
+
+import argparse
+import contextlib
+import io
+import time
+import numpy as np
+import pandas as pd
+
+
+def legacy_select_top_n_answered_questions(questions_answers, c = 0.3, n = 20, max_repeat_exact_answers=2):
+    """The selection loop as it was before vectorization, kept as a reference"""
+    conf_questions = questions_answers[questions_answers['confidence'] > c]
+    answers_count = {k: 0 for k in conf_questions["answer"].unique()}
+    selected_questions = conf_questions.sort_values(by='confidence', ascending=False)
+    for index, row in selected_questions.iterrows():
+        answer = row["answer"]
+        answers_count[answer] = answers_count[answer] + 1
+        if answers_count[answer] > max_repeat_exact_answers:
+            selected_questions.drop(index, inplace=True)
+    return selected_questions.head(n).reset_index().rename(columns={'index':'original_question_number'})
+
+def make_candidates(n_candidates, seed=42):
+    # Few distinct answers relative to questions, as with overlapping chunks of a long document
+    rng = np.random.RandomState(seed)
+    n_answers = max(n_candidates // 4, 1)
+    return pd.DataFrame({'confidence': rng.rand(n_candidates),
+                         'question': [f"Question {i}?" for i in range(n_candidates)],
+                         'answer': [f"answer {i}" for i in rng.randint(0, n_answers, n_candidates)]})
+
+def best_time(function, repeat, *args, **kwargs):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        # Silence the explanatory prints of the selector
+        with contextlib.redirect_stdout(io.StringIO()):
+            result = function(*args, **kwargs)
+        times.append(time.perf_counter() - start)
+    return min(times), result
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000, 10000])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'candidates':>10} {'legacy (ms)':>12} {'vectorized (ms)':>16} {'speedup':>8}")
+    for size in args.sizes:
+        candidates = make_candidates(size)
+        kwargs = dict(c=0.05, n=max(size // 10, 4), max_repeat_exact_answers=1)
+        legacy_time, expected = best_time(legacy_select_top_n_answered_questions, args.repeat, candidates, **kwargs)
+        new_time, result = best_time(select_top_n_answered_questions, args.repeat, candidates, **kwargs)
+        pd.testing.assert_frame_equal(result, expected)
+        print(f"{size:>10} {legacy_time * 1000:>12.2f} {new_time * 1000:>16.2f} {legacy_time / new_time:>7.1f}x")
+
+if __name__ == "__main__":
+    main()
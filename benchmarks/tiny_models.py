@@ -0,0 +1,62 @@
+"""Randomly initialized miniature models for running the benchmarks offline
+
+Every model is built from a config rather than downloaded, and shares a word level
+tokenizer trained on the benchmark corpus, so the whole pipeline runs without network
+access in a few seconds. Timings only exercise the code paths (batching, chunking,
+selection), they say nothing about the speed of the real models.
+"""
+import numpy as np
+
+SPECIAL_TOKENS = ["<pad>", "</s>", "<unk>", "<s>", "<mask>"]
+
+
+def create_tiny_tokenizer(texts, vocab_size=2000):
+    """A fast tokenizer with offsets and a `<s> question </s></s> context </s>` pair template"""
+    from tokenizers import Tokenizer, models, normalizers, pre_tokenizers, processors, trainers
+    from transformers import PreTrainedTokenizerFast
+
+    tokenizer = Tokenizer(models.WordLevel(unk_token="<unk>"))
+    tokenizer.normalizer = normalizers.Lowercase()
+    tokenizer.pre_tokenizer = pre_tokenizers.Whitespace()
+    tokenizer.train_from_iterator(texts, trainers.WordLevelTrainer(vocab_size=vocab_size, special_tokens=SPECIAL_TOKENS))
+    bos, eos = tokenizer.token_to_id("<s>"), tokenizer.token_to_id("</s>")
+    tokenizer.post_processor = processors.TemplateProcessing(
+        single="<s> $A </s>",
+        pair="<s> $A </s> </s> $B:1 </s>:1",
+        special_tokens=[("<s>", bos), ("</s>", eos)])
+
+    return PreTrainedTokenizerFast(tokenizer_object=tokenizer, pad_token="<pad>", eos_token="</s>",
+                                   unk_token="<unk>", bos_token="<s>", cls_token="<s>", sep_token="</s>",
+                                   mask_token="<mask>", model_max_length=512)
+
+def create_tiny_generate_model(tokenizer):
+    from transformers import T5Config, TFT5ForConditionalGeneration
+    config = T5Config(vocab_size=len(tokenizer), d_model=32, d_kv=8, d_ff=64, num_layers=2, num_heads=4,
+                      pad_token_id=tokenizer.pad_token_id, eos_token_id=tokenizer.eos_token_id,
+                      decoder_start_token_id=tokenizer.pad_token_id)
+    model = TFT5ForConditionalGeneration(config)
+    # Build the weights with a dummy forward pass
+    model(input_ids=np.ones((1, 4), dtype="int32"), decoder_input_ids=np.zeros((1, 1), dtype="int32"))
+    return model
+
+def create_tiny_question_answerer(tokenizer):
+    from transformers import RobertaConfig, TFRobertaForQuestionAnswering, pipeline
+    config = RobertaConfig(vocab_size=len(tokenizer), hidden_size=32, num_hidden_layers=2, num_attention_heads=4,
+                           intermediate_size=64, type_vocab_size=2, max_position_embeddings=tokenizer.model_max_length + 2,
+                           pad_token_id=tokenizer.pad_token_id, bos_token_id=tokenizer.bos_token_id,
+                           eos_token_id=tokenizer.eos_token_id)
+    model = TFRobertaForQuestionAnswering(config)
+    model(input_ids=np.ones((1, 4), dtype="int32"))
+    return pipeline("question-answering", model=model, tokenizer=tokenizer)
+
+def create_tiny_score_model(tokenizer, max_length=128):
+    """A Keras model with the same three inputs and three classes as the real score model"""
+    import tensorflow as tf
+    input_ids = tf.keras.layers.Input(shape=(max_length,), dtype=tf.int32, name="input_ids")
+    attention_masks = tf.keras.layers.Input(shape=(max_length,), dtype=tf.int32, name="attention_masks")
+    token_type_ids = tf.keras.layers.Input(shape=(max_length,), dtype=tf.int32, name="token_type_ids")
+    embedded = tf.keras.layers.Embedding(len(tokenizer), 32)(input_ids)
+    embedded = embedded + tf.keras.layers.Embedding(2, 32)(token_type_ids)
+    pooled = tf.keras.layers.GlobalAveragePooling1D()(embedded, mask=tf.cast(attention_masks, tf.bool))
+    output = tf.keras.layers.Dense(3, activation="softmax")(pooled)
+    return tf.keras.Model(inputs=[input_ids, attention_masks, token_type_ids], outputs=output)
@@ -1,33 +1,45 @@
-from transformers import pipeline
-import pandas as pd
+from quizachu.params import *
+from quizachu.lazy import lazy_import
+
+pd = lazy_import("pandas")
 
 
 def create_question_answerer():
-    question_answerer = pipeline(model = 'deepset/roberta-base-squad2')
+    from transformers import pipeline
+    question_answerer = pipeline(model = QA_MODEL_NAME)
     return question_answerer
 
-def answer_questions_with_confidence(question_answerer, context = "You did not specify any content", questions = ["Did you mean to specify a question?"]):
+def answer_question_context_pairs(question_answerer, questions, contexts, batch_size=QA_BATCH_SIZE):
+    """Answers each question against the context at the same position in `contexts`
+    All pairs are passed to the pipeline in a single call, which tokenizes them into
+    padded batches of up to `batch_size` windows per forward pass
+    Returns a list of dicts with the confidence, question and answer, in input order"""
+
+    if len(questions) == 0:
+        return []
+
+    q_as = question_answerer(question=list(questions), context=list(contexts), batch_size=batch_size)
+
+    # The pipeline returns a bare dict rather than a list when given a single pair
+    if isinstance(q_as, dict):
+        q_as = [q_as]
+
+    # Assign the question, and outputs of the question_answerer model to a dictionary per question
+    return [{'confidence': q_a['score'],
+             'question': q,
+             'answer': q_a['answer'].replace('\n', ' ')} for q, q_a in zip(questions, q_as)]
+
+def answer_questions_with_confidence(question_answerer, context = "You did not specify any content", questions = ["Did you mean to specify a question?"], batch_size=QA_BATCH_SIZE):
     """Takes a list called 'questions' that contains the questions to answer
     Takes some text called 'content' as a source for answering questions
     Returns a dataframe of the questions with their answers and an assessment of confidence in the answers
     If no context or content is provided, returns a dataframe requesting these"""
 
-    # List to fill with questions, answers, and confidence
-    questions_answers = []
-
-    # For each question create an empty dictionary and call the question_answerer model on the question
-    for q in questions:
-        q_a_dict = {}
-        q_a = question_answerer(question=q, context=context)
+    # Answer every question against the same context in batched forward passes
+    questions_answers = answer_question_context_pairs(question_answerer, questions, [context] * len(questions), batch_size)
 
-        # Assign the question, and outputs of the question_answerer model to the dictionary
-        q_a_dict['confidence'] = q_a['score']
-        q_a_dict['question'] = q
-        q_a_dict['answer'] = q_a['answer'].replace('\n', ' ')
-
-        # Add the dictionary to the list and then convert the final list of dicts to a dataframe
-        questions_answers.append(q_a_dict)
-    questions_answers = pd.DataFrame(questions_answers)
+    # Convert the final list of dicts to a dataframe
+    questions_answers = pd.DataFrame(questions_answers, columns=['confidence', 'question', 'answer'])
 
     return questions_answers
 
@@ -38,22 +50,22 @@ def select_top_n_questions(question_answerer, context, questions, c = 0.3, n = 2
     # Call answer_questions to get a df of questions and answers
     questions_answers = answer_questions_with_confidence(question_answerer, context, questions)
 
+    return select_top_n_answered_questions(questions_answers, c, n, max_repeat_exact_answers)
+
+def select_top_n_answered_questions(questions_answers, c = 0.3, n = 20, max_repeat_exact_answers=2):
+    """Selects the top n questions with the highest confidence level c
+    from a dataframe of questions already answered by answer_questions_with_confidence"""
+
     # Filter for confidence
     conf_questions = questions_answers[questions_answers['confidence'] > c]
 
-    # Create a dictionary with a key for each unique answer
-    # which will be updated with frequency of occurrence
-    answers_count = {k: 0 for k in conf_questions["answer"].unique()}
-
     # Sort questions by confidence
     selected_questions = conf_questions.sort_values(by='confidence', ascending=False)
 
     # Remove questions/answers for which the answer occurs more then `max_repeat_exact_answers` times
-    for index, row in selected_questions.iterrows():
-        answer = row["answer"]
-        answers_count[answer] = answers_count[answer] + 1
-        if answers_count[answer] > max_repeat_exact_answers:
-            selected_questions.drop(index, inplace=True)
+    # (cumcount numbers the rows of each answer in confidence order, starting from 0)
+    answer_rank = selected_questions.groupby('answer', sort=False).cumcount()
+    selected_questions = selected_questions[answer_rank < max_repeat_exact_answers]
 
     selected_questions = selected_questions.head(n).reset_index().rename(columns={'index':'original_question_number'})
 
@@ -83,3 +95,90 @@ def select_top_n_questions(question_answerer, context, questions, c = 0.3, n = 2
             print(f"Here are your {n} questions")
 
     return selected_questions
+
+class QuestionSelector:
+    """Applies the confidence and duplicate answer filters of `select_top_n_questions`
+    to questions as they are answered, so that results can be streamed
+
+    Each call to `add` returns the new rows that pass the filters, highest confidence first,
+    until `n` questions have been selected in total"""
+
+    def __init__(self, c = 0.3, n = 20, max_repeat_exact_answers=2):
+        self.c = c
+        self.n = n
+        self.max_repeat_exact_answers = max_repeat_exact_answers
+        self.answers_count = {}
+        self.selected = 0
+
+    @property
+    def done(self):
+        return self.selected >= self.n
+
+    def add(self, questions_answers):
+        accepted = []
+        conf_questions = questions_answers[questions_answers['confidence'] > self.c]
+        for row in conf_questions.sort_values(by='confidence', ascending=False).to_dict('records'):
+            if self.done:
+                break
+
+            # Skip questions whose answer has already been selected `max_repeat_exact_answers` times
+            answer = row['answer']
+            self.answers_count[answer] = self.answers_count.get(answer, 0) + 1
+            if self.answers_count[answer] > self.max_repeat_exact_answers:
+                continue
+
+            accepted.append(row)
+            self.selected += 1
+        return accepted
+
+class RunningTopN:
+    """Keeps the selection of `select_top_n_answered_questions` up to date as questions are answered,
+    so that a long context can stop being processed once its selection is complete
+
+    Only the current top n rows are kept: a row pushed out of them, by confidence or by the
+    `max_repeat_exact_answers` limit, can never come back as more rows arrive.
+
+    The early stop `policy` decides when the selection is complete:
+    - "exhaustive": never, every chunk is processed (the selection does not depend on chunk order)
+    - "full": as soon as `n` questions pass the filters
+    - "confident": once `n` questions pass the filters with a confidence of at least `min_confidence`,
+      so that questions from the remaining chunks are unlikely to replace them"""
+
+    def __init__(self, c = 0.3, n = 20, max_repeat_exact_answers=2, policy=EARLY_STOP_POLICY,
+                 min_confidence=EARLY_STOP_MIN_CONFIDENCE):
+        if policy not in EARLY_STOP_POLICIES:
+            raise ValueError(f"Unknown early stop policy {policy!r}, expected one of {', '.join(EARLY_STOP_POLICIES)}")
+        self.c = c
+        self.n = n
+        self.max_repeat_exact_answers = max_repeat_exact_answers
+        self.policy = policy
+        self.min_confidence = min_confidence
+        self.top = []
+
+    @property
+    def full(self):
+        return len(self.top) >= self.n
+
+    @property
+    def done(self):
+        if self.policy == "full":
+            return self.full
+        if self.policy == "confident":
+            return self.full and self.top[-1]['confidence'] >= self.min_confidence
+        return False
+
+    def add(self, questions_answers):
+        conf_questions = questions_answers[questions_answers['confidence'] > self.c].to_dict('records')
+        # Sorting is stable, so rows of equal confidence keep their arrival order
+        ranked = sorted(self.top + conf_questions, key=lambda row: -row['confidence'])
+
+        top = []
+        answers_count = {}
+        for row in ranked:
+            answers_count[row['answer']] = answers_count.get(row['answer'], 0) + 1
+            if answers_count[row['answer']] > self.max_repeat_exact_answers:
+                continue
+            top.append(row)
+            if len(top) == self.n:
+                break
+        self.top = top
@@ -1,31 +1,377 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
-from quizachu.generate.model import create_generate_model, create_generate_tokenizer, generate_questions
-from quizachu.answer.model import create_question_answerer, select_top_n_questions
-from quizachu.score.model import create_generate_score_model, check_answer_similarity
-from typing import Optional
-
+from quizachu.generate.model import create_generate_model, create_generate_tokenizer, generate_questions_batch
+from quizachu.generate.planner import GenerationPlanner, default_plan
+from quizachu.generate.dedup import QuestionDeduplicator
+from quizachu.answer.model import create_question_answerer, answer_question_context_pairs, select_top_n_answered_questions, QuestionSelector
+from quizachu.answer.model import RunningTopN
+from quizachu.score.model import AnswerScorer
+from quizachu.api.scheduler import BatchScheduler
+from quizachu.api.metrics import REGISTRY, QUEUE_DEPTH, CACHE_LOOKUPS, MODEL_LOAD_SECONDS, REQUEST_SECONDS, QUESTIONS_DEDUPLICATED
+from quizachu.api.metrics import EARLY_STOP_CHUNKS_SKIPPED
+from quizachu.api.metrics import span, timed, request_timings, server_timing_header
+from quizachu.api.sessions import ContextStore
+from quizachu.api.singleflight import SingleFlight
+from quizachu.cache import ResultCache, make_cache_key
+from quizachu.chunking import plan_question_generation, coverage_order, pipeline_chunk_group
+from quizachu.registry import get_generate_weights_path, get_model_id
+from quizachu.lazy import lazy_import
+from quizachu.params import SCHEDULER_MAX_WAIT_MS, SCHEDULER_MAX_BATCH_SIZE, GENERATE_BATCH_SIZE, EAGER_MODEL_LOADING
+from quizachu.params import CACHE_ENABLED, CACHE_MAX_BYTES, CACHE_DIR, QA_MODEL_NAME, GENERATE_BACKEND, SERVER_TIMING
+from quizachu.params import CONTEXT_SESSION_TTL_S, CONTEXT_SESSION_MAX, CONTEXT_SESSION_MAX_ANSWERS, QUESTION_DEDUP_ENABLED
+from quizachu.params import PIPELINE_QUEUE_SIZE, EARLY_STOP_POLICY
+from typing import List, Literal, Optional
+
+from concurrent.futures import ThreadPoolExecutor
+
+import asyncio
+import json
+import threading
 import time
 import more_itertools as mit
 
+# Only loaded when the first answers are put in a dataframe, so that the API starts fast
+pd = lazy_import("pandas")
+
 class QuestionGenerateRequest(BaseModel):
-    context: str
+    context: Optional[str] = None
+    context_id: Optional[str] = None
     allow_duplicates: Optional[bool] = False
+    stream: Optional[Literal["ndjson", "sse"]] = None
+    latency_budget_ms: Optional[float] = None
+    early_stop: Optional[Literal["exhaustive", "full", "confident"]] = None
 
 class AnswerGenerateRequest(BaseModel):
-    context: str
+    context: Optional[str] = None
+    context_id: Optional[str] = None
     questions: list
 
+class ContextCreateRequest(BaseModel):
+    context: str
+
 class AnswerScoreRequest(BaseModel):
     sentence1: str
     sentence2: str
 
+class AnswerBatchScoreRequest(BaseModel):
+    answers: List[AnswerScoreRequest]
+
 app = FastAPI()
 # Initialize null states which will be loaded dynamically when methods are called for the first time
 app.state.generate_model = None
 app.state.generate_tokenizer = None
+app.state.generate_model_id = None
+# Fetched once, so that the weights loaded and the model id in cache keys are the same version
+app.state.generate_weights_path = None
 app.state.question_answerer = None
-app.state.score_model = None
+# The answer scorer keeps its model and tokenizer once loaded
+# (with SCORE_BACKEND=shared_encoder, it scores with the question answerer's encoder instead)
+app.state.answer_scorer = AnswerScorer(question_answerer=lambda: load_question_answerer())
+
+# Without eager loading the API is ready straight away and models load on first use
+app.state.ready = not EAGER_MODEL_LOADING
+app.state.warm_up_error = None
+
+# Generated questions and per-question answers, keyed on the content they were computed from
+app.state.result_cache = ResultCache(max_bytes=CACHE_MAX_BYTES, directory=CACHE_DIR) if CACHE_ENABLED else None
+
+# Documents uploaded to /contexts, referenced by context_id in later requests
+app.state.context_store = ContextStore(max_sessions=CONTEXT_SESSION_MAX, ttl=CONTEXT_SESSION_TTL_S,
+                                       max_answers=CONTEXT_SESSION_MAX_ANSWERS)
+
+# Identical requests in flight, computed once for all of their callers
+app.state.single_flight = SingleFlight()
+
+# Picks beam search/sampling settings for requests with a latency budget
+app.state.generation_planner = GenerationPlanner()
+
+# Models may be loaded by the warm-up threads and the scheduler at the same time
+generate_model_lock = threading.Lock()
+generate_weights_lock = threading.Lock()
+generate_tokenizer_lock = threading.Lock()
+question_answerer_lock = threading.Lock()
+
+def get_pinned_generate_weights_path():
+    """Returns the path of the generate weights, fetched from the model store on first use only
+    (a newer version published later is picked up on restart)"""
+    with generate_weights_lock:
+        if not app.state.generate_weights_path:
+            app.state.generate_weights_path = get_generate_weights_path()
+
+    return app.state.generate_weights_path
+
+def get_generate_model_id():
+    return f"{GENERATE_BACKEND}:{get_model_id(get_pinned_generate_weights_path())}"
+
+def load_generate_tokenizer():
+    with generate_tokenizer_lock:
+        if not app.state.generate_tokenizer:
+            with timed(MODEL_LOAD_SECONDS, model="generate_tokenizer"):
+                app.state.generate_tokenizer = create_generate_tokenizer()
+
+    return app.state.generate_tokenizer
+
+def load_generate_model():
+    with generate_model_lock:
+        if not app.state.generate_model:
+            with timed(MODEL_LOAD_SECONDS, model="generate"):
+                app.state.generate_model = create_generate_model(get_pinned_generate_weights_path())
+            app.state.generate_model_id = get_generate_model_id()
+
+    return app.state.generate_model, load_generate_tokenizer()
+
+def load_question_answerer():
+    with question_answerer_lock:
+        if not app.state.question_answerer:
+            with timed(MODEL_LOAD_SECONDS, model="answer"):
+                app.state.question_answerer = create_question_answerer()
+
+    return app.state.question_answerer
+
+def load_answer_scorer():
+    if app.state.answer_scorer.model is None:
+        with timed(MODEL_LOAD_SECONDS, model="score"):
+            app.state.answer_scorer.load()
+
+    return app.state.answer_scorer
+
+# Batch handlers, run on the scheduler's worker thread. Each takes the payloads queued by
+# concurrent requests and returns one result per payload, in the same order.
+def run_generate_batch(payloads):
+    """Payloads are (context, plan) tuples, results are lists of questions"""
+    model, tokenizer = load_generate_model()
+
+    # Contexts with the same generation plan share batched generate calls
+    positions = {}
+    for i, (_, plan) in enumerate(payloads):
+        positions.setdefault(plan, []).append(i)
+
+    results = [None] * len(payloads)
+    for plan, indexes in positions.items():
+        for batch in mit.chunked(indexes, GENERATE_BATCH_SIZE):
+            contexts = [payloads[i][0] for i in batch]
+            start = time.perf_counter()
+            for i, questions in zip(batch, generate_questions_batch(model, tokenizer, contexts, plan=plan)):
+                results[i] = questions
+
+            # Calibrate the planner's cost model with the measured time
+            measured_ms = (time.perf_counter() - start) * 1000
+            context_tokens = [len(input_ids) for input_ids in tokenizer(contexts).input_ids]
+            app.state.generation_planner.observe(plan, context_tokens, measured_ms)
+    return results
+
+def run_answer_batch(payloads):
+    """Payloads are (context, questions) tuples, results are dataframes of answered questions"""
+    question_answerer = load_question_answerer()
+
+    # Answer the questions of every request in the same batched pipeline call
+    questions, contexts = [], []
+    for context, request_questions in payloads:
+        questions.extend(request_questions)
+        contexts.extend([context] * len(request_questions))
+    rows = answer_question_context_pairs(question_answerer, questions, contexts)
+
+    results = []
+    start = 0
+    for _, request_questions in payloads:
+        end = start + len(request_questions)
+        results.append(pd.DataFrame(rows[start:end], columns=['confidence', 'question', 'answer']))
+        start = end
+    return results
+
+def run_score_batch(payloads):
+    """Payloads are lists of (sentence1, sentence2) tuples, results are lists of prediction dicts"""
+
+    # Score the pairs of every request in the same batched predictions
+    sentence_pairs = [pair for request_pairs in payloads for pair in request_pairs]
+    scores = load_answer_scorer().score_pairs(sentence_pairs)
+
+    results = []
+    start = 0
+    for request_pairs in payloads:
+        end = start + len(request_pairs)
+        results.append(scores[start:end])
+        start = end
+    return results
+
+BATCH_HANDLERS = {"generate": run_generate_batch,
+                  "answer": run_answer_batch,
+                  "score": run_score_batch}
+
+app.state.scheduler = BatchScheduler(BATCH_HANDLERS,
+                                     max_wait=SCHEDULER_MAX_WAIT_MS / 1000,
+                                     max_batch_size=SCHEDULER_MAX_BATCH_SIZE)
+QUEUE_DEPTH.set_function(lambda: app.state.scheduler.qsize())
+
+# Model warm-up, used when EAGER_MODEL_LOADING is set
+WARM_UP_CONTEXT = "The Netherlands was founded in 1815 after the defeat of Napoleon."
+
+def warm_up_generate_model():
+    model, tokenizer = load_generate_model()
+    generate_questions_batch(model, tokenizer, [WARM_UP_CONTEXT], 4)
+
+def warm_up_question_answerer():
+    question_answerer = load_question_answerer()
+    answer_question_context_pairs(question_answerer, ["When was the Netherlands founded?"], [WARM_UP_CONTEXT])
+
+def warm_up_score_model():
+    load_answer_scorer().score("in 1815", "1815")
+
+def warm_up_models():
+    """Loads every model concurrently and runs a dummy inference through each one,
+    then marks the API as ready"""
+    start = time.time()
+    try:
+        with ThreadPoolExecutor(max_workers=3) as executor:
+            futures = [executor.submit(warm_up) for warm_up in (warm_up_generate_model,
+                                                                warm_up_question_answerer,
+                                                                warm_up_score_model)]
+            for future in futures:
+                future.result()
+    except Exception as e:
+        app.state.warm_up_error = repr(e)
+        print(f"\n❌ Model warm-up failed: {e!r}")
+        return
+
+    app.state.ready = True
+    print(f"✅ Models loaded and warmed up in {time.time() - start:.1f}s")
+
+@app.on_event("startup")
+def start_warm_up():
+    if EAGER_MODEL_LOADING:
+        threading.Thread(target=warm_up_models, name="model-warm-up", daemon=True).start()
+
+@app.on_event("shutdown")
+def stop_scheduler():
+    app.state.scheduler.stop()
+
+# Cached access to the models. Lookups are skipped until the generate model has been
+# loaded, since its weights identity is part of the key.
+async def generate_questions_cached(contexts, n_questions, plan=None):
+    """Returns a list of generated questions for each context, only generating for cache misses
+    Sampled plans are not deterministic, so they always generate"""
+    plan = plan or default_plan(n_questions)
+    cache = app.state.result_cache if not plan.do_sample else None
+    keys = [None] * len(contexts)
+    results = [None] * len(contexts)
+    if cache is not None and app.state.generate_model_id:
+        for i, context in enumerate(contexts):
+            keys[i] = make_cache_key("generate", app.state.generate_model_id, context, **plan._asdict())
+            results[i] = cache.get(keys[i])
+            CACHE_LOOKUPS.inc(namespace="generate", result="miss" if results[i] is None else "hit")
+
+    misses = [i for i, questions in enumerate(results) if questions is None]
+    generated = await asyncio.gather(*[app.state.scheduler.submit("generate", (contexts[i], plan)) for i in misses])
+
+    for i, questions in zip(misses, generated):
+        results[i] = questions
+        if cache is not None:
+            key = keys[i] or make_cache_key("generate", app.state.generate_model_id, contexts[i], **plan._asdict())
+            cache.set(key, questions)
+    return results
+
+async def answer_questions_cached(context, questions, session=None):
+    """Returns a dataframe of answered questions, only answering questions missing from the cache
+    Questions already answered in the context `session` are reused first"""
+    cache = app.state.result_cache
+    rows = session.get_answers(questions) if session is not None else [None] * len(questions)
+    keys = [make_cache_key("answer", QA_MODEL_NAME, context, question=q) for q in questions] if cache is not None else []
+    if cache is not None:
+        lookups = [i for i, row in enumerate(rows) if row is None]
+        for i in lookups:
+            rows[i] = cache.get(keys[i])
+        hits = sum(rows[i] is not None for i in lookups)
+        CACHE_LOOKUPS.inc(hits, namespace="answer", result="hit")
+        CACHE_LOOKUPS.inc(len(lookups) - hits, namespace="answer", result="miss")
+
+    misses = [i for i, row in enumerate(rows) if row is None]
+    if misses:
+        answered = await app.state.scheduler.submit("answer", (context, [questions[i] for i in misses]))
+        for i, row in zip(misses, answered.to_dict("records")):
+            rows[i] = row
+            if cache is not None:
+                cache.set(keys[i], row)
+
+    if session is not None:
+        session.set_answers(rows)
+    return pd.DataFrame(rows, columns=['confidence', 'question', 'answer'])
+
+def deduplicate(deduplicator, questions):
+    kept = deduplicator.add(questions)
+    QUESTIONS_DEDUPLICATED.inc(len(questions) - len(kept))
+    return kept
+
+def resolve_context(request):
+    """Returns the context of a request and its session, when it references one by `context_id`"""
+    if request.context_id is not None:
+        session = app.state.context_store.get(request.context_id)
+        if session is None:
+            raise HTTPException(status_code=404, detail=f"Unknown or expired context_id {request.context_id}")
+        return session.context, session
+    if request.context is None:
+        raise HTTPException(status_code=422, detail="Either context or context_id is required")
+    return request.context, None
+
+async def plan_question_generation_for(context, session=None):
+    """Plans question generation for `context`, once per session when there is one
+    Loading the tokenizer and tokenizing a whole document take a while, so this runs in a
+    worker thread to keep the event loop free for other requests"""
+    compute = lambda context: plan_question_generation(load_generate_tokenizer(), context)
+    plan = (lambda: session.get_plan(compute)) if session is not None else (lambda: compute(context))
+    return await asyncio.get_running_loop().run_in_executor(None, plan)
+
+async def stream_questions_and_answers(context, n_questions, contexts, plan, max_repeat_exact_answers, stream_format, session=None):
+    """Yields validated question/answer records chunk by chunk, as NDJSON lines or server-sent events"""
+    selector = QuestionSelector(c=0.05, n=n_questions, max_repeat_exact_answers=max_repeat_exact_answers)
+    deduplicator = QuestionDeduplicator() if QUESTION_DEDUP_ENABLED else None
+
+    for chunk in contexts:
+        if selector.done:
+            break
+
+        with span("generate"):
+            chunk_questions = [q for q in (await generate_questions_cached([chunk], plan.n_questions, plan))[0] if q]
+        if deduplicator is not None:
+            with span("dedup"):
+                chunk_questions = deduplicate(deduplicator, chunk_questions)
+        with span("answer"):
+            questions_answers = await answer_questions_cached(context, chunk_questions, session)
+        with span("select"):
+            selected = selector.add(questions_answers)
+
+        for row in selected:
+            record = json.dumps({"confidence_score": float(row["confidence"]),
+                                 "question": row["question"],
+                                 "answer": row["answer"]})
+            yield f"data: {record}\n\n" if stream_format == "sse" else f"{record}\n"
+
+    if stream_format == "sse":
+        yield "event: end\ndata: {}\n\n"
+
+@app.middleware("http")
+async def record_request_timings(request: Request, call_next):
+    """Times every request, and adds a Server-Timing header with its stages when SERVER_TIMING is set
+    Streamed responses are left without the header, since it is sent before their stages run"""
+    timings = []
+    token = request_timings.set(timings)
+    start = time.perf_counter()
+    try:
+        response = await call_next(request)
+    finally:
+        request_timings.reset(token)
+    total = time.perf_counter() - start
+
+    # Label by route template rather than raw path, so that the number of series stays bounded
+    route = request.scope.get("route")
+    path = route.path if route is not None else "unmatched"
+    REQUEST_SECONDS.observe(total, path=path, method=request.method, status=response.status_code)
+
+    media_type = response.headers.get("content-type", "")
+    if SERVER_TIMING and not media_type.startswith(("text/event-stream", "application/x-ndjson")):
+        response.headers["Server-Timing"] = server_timing_header(timings, total)
+    return response
 
 @app.get("/ping")
 def ping():
@@ -34,6 +380,79 @@ def ping():
     """
     return {"response": "ping"}
 
+@app.get("/ready")
+def ready():
+    """
+    Return whether the models are loaded and warmed up, with status 503 until they are,
+    along with the number of times the score model has been loaded.
+    """
+    score_model_loads = app.state.answer_scorer.load_count
+    if not app.state.ready:
+        return JSONResponse(status_code=503, content={"ready": False,
+                                                      "error": app.state.warm_up_error,
+                                                      "score_model_loads": score_model_loads})
+    return {"ready": True, "score_model_loads": score_model_loads}
+
+@app.get("/cache-stats")
+def cache_stats():
+    """
+    Return hit/miss statistics of the result cache, and the number of context sessions held.
+    """
+    sessions = app.state.context_store.stats()
+    if app.state.result_cache is None:
+        return {"enabled": False, "context_sessions": sessions}
+    return {"enabled": True, **app.state.result_cache.stats(), "context_sessions": sessions}
+
+@app.get("/metrics")
+def metrics():
+    """
+    Return request, stage, batching, model load and cache metrics in the Prometheus text format.
+    """
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+# Context sessions
+@app.post("/contexts")
+def create_context_api(request: ContextCreateRequest):
+    """ Upload a context
+
+    Upload a document once, to reference it by `context_id` in later requests instead of sending it again.
+    Its question generation plan and the answers found on it are kept with it.
+
+    JSON Fields:
+    ------------
+    `context` (str): The document.
+
+    Returns:
+    ____________
+    `context_id` (str): The id to pass in later requests. Uploading the same document again returns the same id.
+
+    `expires_in_s` (float): Seconds until the context expires if unused. Every use extends it.
+    """
+    session = app.state.context_store.create(request.context)
+    return {"context_id": session.context_id, "expires_in_s": app.state.context_store.expires_in(session)}
+
+@app.get("/contexts/{context_id}")
+def get_context_api(context_id: str):
+    """
+    Return whether a context is still available, with the number of questions answered on it.
+    """
+    session = app.state.context_store.get(context_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail=f"Unknown or expired context_id {context_id}")
+    return {"context_id": context_id,
+            "words": len(session.context.split()),
+            "answered_questions": len(session.answers),
+            "expires_in_s": app.state.context_store.expires_in(session)}
+
+@app.delete("/contexts/{context_id}")
+def delete_context_api(context_id: str):
+    """
+    Drop a context before it expires.
+    """
+    if not app.state.context_store.delete(context_id):
+        raise HTTPException(status_code=404, detail=f"Unknown or expired context_id {context_id}")
+    return {"deleted": context_id}
+
 # Question Generation
 @app.post("/generate-questions")
 async def generate_questions_api(request: QuestionGenerateRequest):
@@ -45,6 +464,8 @@ async def generate_questions_api(request: QuestionGenerateRequest):
     ------------
     `context` (str): The provided context from which questions should be generated.
 
+    `context_id` (str, optional): The id of a context uploaded to /contexts, instead of `context`.
+
     `num_questions` (int, optional): The number of questions to return.
 
     Returns:
@@ -52,18 +473,12 @@ async def generate_questions_api(request: QuestionGenerateRequest):
     `questions` (list): A list of `str` questions generated from the context of length `num_questions`.
     """
 
-    if not app.state.generate_model:
-        app.state.generate_model = create_generate_model()
+    async def generate():
+        context, _ = resolve_context(request)
+        with span("generate"):
+            return (await generate_questions_cached([context], 10))[0]
 
-    if not app.state.generate_tokenizer:
-        app.state.generate_tokenizer = create_generate_tokenizer()
-
-    tokenizer = app.state.generate_tokenizer
-    model = app.state.generate_model
-
-    questions = generate_questions(model, tokenizer, request.context, 10)
-
-    return questions
+    return await app.state.single_flight.run("generate-questions", jsonable_encoder(request), generate)
 
 # Golden Answer Generator from Context & Question
 @app.post("/generate-answers")
@@ -76,6 +491,9 @@ async def generate_answers_api(request: AnswerGenerateRequest):
     ------------
     `context` (str): The provided context from which an answer should be generated.
 
+    `context_id` (str, optional): The id of a context uploaded to /contexts, instead of `context`.
+    Questions already answered on that context are not answered again.
+
     `question` (list): The questions to answer.
 
     Returns:
@@ -83,12 +501,147 @@ async def generate_answers_api(request: AnswerGenerateRequest):
     `golden_answers` (list): The most likely correct answer to the given question.
     """
 
-    if not app.state.question_answerer:
-        app.state.question_answerer = create_question_answerer()
+    async def answer():
+        context, session = resolve_context(request)
+        with span("answer"):
+            questions_answers = await answer_questions_cached(context, request.questions, session)
+        with span("select"):
+            response = select_top_n_answered_questions(questions_answers)
+        return response.to_dict()
+
+    return await app.state.single_flight.run("generate-answers", jsonable_encoder(request), answer)
+
+def question_chunks(questions, chunks, kept):
+    """Returns the chunk of each question of `kept`, a subsequence of `questions` (from `chunks`)"""
+    kept_chunks = []
+    i = 0
+    for question in kept:
+        while questions[i] != question:
+            i += 1
+        kept_chunks.append(chunks[i])
+        i += 1
+    return kept_chunks
+
+async def generate_and_answer_questions(context, contexts, questions_per_context, plan, session=None, running_top=None,
+                                        order=None):
+    """Generates questions for the chunks of `contexts` and answers them against the whole `context`
+
+    Chunks are generated in groups (see `pipeline_chunk_group`) handed to the answering side through
+    a queue of at most PIPELINE_QUEUE_SIZE groups, so that the QA model answers a group's questions
+    while flan-t5 generates the next group (each runs on its own scheduler lane), and the total time
+    approaches that of the slower model rather than the sum of both.
+    Chunks are processed in `order` (a list of their indexes, in document order by default), and
+    with a `RunningTopN`, stop being generated and answered as soon as it is done.
+    Returns a dataframe of every answered question, in document order as if generated in one go
+    (whatever the processing order), and the time spent generating in ms."""
+    groups = asyncio.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+    generate_ms = 0.0
+
+    async def produce():
+        nonlocal generate_ms
+        try:
+            for group in mit.chunked(order or range(len(contexts)), pipeline_chunk_group(len(contexts))):
+                with span("generate") as generate_span:
+                    questions_lists = await generate_questions_cached([contexts[i] for i in group],
+                                                                      questions_per_context, plan)
+                generate_ms += generate_span.duration * 1000
+                # Flatten the group's questions, leaving out empty strings, and remember their chunk
+                pairs = [(i, q) for i, questions in zip(group, questions_lists) for q in questions if q]
+                await groups.put((len(group), [q for _, q in pairs], [i for i, _ in pairs]))
+            await groups.put(None)
+        except Exception as e:
+            await groups.put(e)
+
+    producer = asyncio.ensure_future(produce())
+    # Drop paraphrases of the same question (frequent across overlapping chunks) before answering,
+    # comparing each group with the questions kept from the groups before it
+    deduplicator = QuestionDeduplicator() if QUESTION_DEDUP_ENABLED else None
+    answered = []
+    answered_chunks = []
+    chunks_done = 0
+    try:
+        while True:
+            group = await groups.get()
+            if group is None:
+                break
+            if isinstance(group, Exception):
+                raise group
+            n_chunks, questions, chunks = group
+            if deduplicator is not None:
+                with span("dedup"):
+                    kept = deduplicate(deduplicator, questions)
+                questions, chunks = kept, question_chunks(questions, chunks, kept)
+            with span("answer"):
+                answered.append(await answer_questions_cached(context, questions, session))
+            answered_chunks.extend(chunks)
+            chunks_done += n_chunks
+
+            if running_top is not None:
+                with span("select"):
+                    running_top.add(answered[-1])
+                if running_top.done:
+                    EARLY_STOP_CHUNKS_SKIPPED.inc(len(contexts) - chunks_done, policy=running_top.policy)
+                    break
+    finally:
+        producer.cancel()
+
+    answered = [questions_answers for questions_answers in answered if len(questions_answers)]
+    if not answered:
+        return pd.DataFrame([], columns=['confidence', 'question', 'answer']), generate_ms
+    # Number the questions in document order, whatever order the chunks were processed in
+    questions_answers = pd.concat(answered, ignore_index=True)
+    questions_answers = questions_answers.iloc[pd.Series(answered_chunks).argsort(kind="stable").to_numpy()]
+    return questions_answers.reset_index(drop=True), generate_ms
+
+async def generate_questions_and_answers(request):
+    context, session = resolve_context(request)
+    with span("tokenize"):
+        n_questions, contexts, questions_per_context, context_tokens = await plan_question_generation_for(context, session)
+
+    # Fit the beam search configuration to the latency budget, if one was given
+    plan, estimated_ms = app.state.generation_planner.plan(questions_per_context, context_tokens, request.latency_budget_ms)
+
+    max_repeat_exact_answers=1
+    if request.allow_duplicates:
+        max_repeat_exact_answers=2
+
+    if request.stream:
+        records = stream_questions_and_answers(context, n_questions, contexts, plan,
+                                               max_repeat_exact_answers, request.stream, session)
+        media_type = "text/event-stream" if request.stream == "sse" else "application/x-ndjson"
+        return StreamingResponse(records, media_type=media_type)
+
+    # Unless every chunk is processed, start with chunks spread over the whole text, and stop
+    # once the running selection is complete according to the early stop policy
+    running_top = None
+    order = None
+    policy = request.early_stop or EARLY_STOP_POLICY
+    if policy != "exhaustive" and len(contexts) > 1:
+        order = coverage_order(len(contexts))
+        running_top = RunningTopN(c=0.05, n=n_questions, max_repeat_exact_answers=max_repeat_exact_answers,
+                                  policy=policy)
+
+    # Generate questions chunk group by chunk group, answering each group while the next one is generated
+    questions_answers, generate_ms = await generate_and_answer_questions(context, contexts, questions_per_context,
+                                                                         plan, session, running_top, order)
+
+    # Keep the top questions over all chunks, filtering low conficence questions/answers
+    with span("select"):
+        response = select_top_n_answered_questions(questions_answers,
+                                        c=0.05,
+                                        n=n_questions,
+                                        max_repeat_exact_answers=max_repeat_exact_answers)
 
-    response = select_top_n_questions(app.state.question_answerer, request.context, request.questions)
+    response.drop(columns=["original_question_number"], inplace=True)
+    response.columns = ["confidence_score", "questions", "answers"]
 
-    return response.to_dict()
+    response = response.to_dict()
+    if request.latency_budget_ms is not None:
+        response["metadata"] = {"latency_budget_ms": request.latency_budget_ms,
+                                "generation_plan": plan._asdict(),
+                                "estimated_generate_ms": estimated_ms,
+                                "measured_generate_ms": generate_ms}
+    return response
 
 @app.post("/generate-questions-and-answers")
 async def generate_questions_and_answers_api(request: QuestionGenerateRequest):
@@ -100,8 +653,23 @@ async def generate_questions_and_answers_api(request: QuestionGenerateRequest):
     ------------
     `context` (str): The provided context from which questions and answers should be generated.
 
+    `context_id` (str, optional): The id of a context uploaded to /contexts, instead of `context`.
+
     `allow_duplicates` (bool, optional): Whether questions with duplicate answers should be returned (default: False)
 
+    `latency_budget_ms` (float, optional): Target time for question generation. Beam search is scaled down (or replaced
+    by sampling) to fit it, and the chosen plan and its cost are returned under `metadata`.
+
+    `stream` (str, optional): "ndjson" or "sse" to stream each validated question/answer record as soon as it passes
+    the confidence and duplicate answer filters, chunk by chunk. Streamed records come in generation order, so
+    they can differ from the top-n selection of the non-streaming response.
+
+    `early_stop` (str, optional): "exhaustive", "full" or "confident", how soon to stop processing the chunks of a
+    long context once enough questions are selected (default: the EARLY_STOP_POLICY setting). "full" stops as soon as
+    enough questions pass the filters, "confident" once they also all reach EARLY_STOP_MIN_CONFIDENCE. Chunks are
+    then processed spread over the whole text rather than from its start (candidates are still numbered in document
+    order). Settings other than "exhaustive" can return different questions for the same document.
+
     Returns:
     ------------
 
@@ -112,82 +680,11 @@ async def generate_questions_and_answers_api(request: QuestionGenerateRequest):
     `answers` (list): most likely answers found by answering model
     """
 
-    start = time.time()
-
-    if not app.state.generate_model:
-        app.state.generate_model = create_generate_model()
-
-    if not app.state.generate_tokenizer:
-        app.state.generate_tokenizer = create_generate_tokenizer()
-
-    if not app.state.question_answerer:
-        app.state.question_answerer = create_question_answerer()
-
-    tokenizer = app.state.generate_tokenizer
-    model = app.state.generate_model
-
-    context_length = len(request.context.split())
-
-    questions_lists = []
-
-    # Scale the number of questions/answers generated according to the context length
-    # Add another question per 150 words of context
-    n_questions = 4 + context_length // 150
-
-    # If context is longer than 450 words, split into overlapping chunks
-    if context_length > 450:
-        n_chunks = n_questions
-        # The width of each chunk should be n_chunks - 2 (to allow overlapping)
-        # (use max() to prevent divide by zero in case of earlier error)
-        width_factor = max(n_chunks - 2, 2)
-
-        # Create n overlapping chunks of size context_length // width_factor
-        #
-        # First, the context becomes a list through .split()
-        # Then the entire list is split into chunks.
-        # Where the chunks are not equal, blank strings are filled.
-        # This leaves a 2D list of strings. Each chunk is reassembled from list to string via " ".join()
-        chunks = [' '.join(window) for window in mit.windowed(request.context.split(), n=context_length//width_factor, step=context_length//n_chunks, fillvalue="")]
-
-        # For each chunk, generate questions to be passed to the answer generation model
-        for chunk in chunks:
-            chunk_questions = generate_questions(model, tokenizer, chunk, 4)
-            questions_lists.append(chunk_questions)
-
-    # If context is less than 450 words (~512 tokens), pass whole context to question generation
-    else:
-        questions_lists.append(generate_questions(model, tokenizer, request.context, n_questions*4))
-
-    check1 = time.time()
-    print(f"Question generation time: {check1 - start}")
-
-    # Create a flattened question list
-    questions = []
-    for l in questions_lists:
-        for q in l:
-            # Do not append to the list if the question is an empty string
-            if q:
-                questions.append(q)
-
-    max_repeat_exact_answers=1
-    if request.allow_duplicates:
-        max_repeat_exact_answers=2
-
-    # Pass questions and context to answer generator, filtering low conficence questions/answers
-    response = select_top_n_questions(app.state.question_answerer,
-                                    request.context,
-                                    questions,
-                                    c=0.05,
-                                    n=n_questions,
-                                    max_repeat_exact_answers=max_repeat_exact_answers)
-
-    response.drop(columns=["original_question_number"], inplace=True)
-    response.columns = ["confidence_score", "questions", "answers"]
-    check2 = time.time()
-    print(f"Answer generation time: {check2 - check1}")
-    print(f"Total execution time: {check2 - start}")
-
-    return response.to_dict()
+    # Identical requests in flight share one computation (streamed responses are produced for each client)
+    if request.stream:
+        return await generate_questions_and_answers(request)
+    return await app.state.single_flight.run("generate-questions-and-answers", jsonable_encoder(request),
+                                             lambda: generate_questions_and_answers(request))
 
 
 # Answer Scoring
@@ -207,9 +704,27 @@ async def generate_scores_api(request: AnswerScoreRequest):
     ____________
     `results` (dict): The predication and probability of the given answer
     """
-    if not app.state.score_model:
-        score_model = create_generate_score_model()
+    with span("score"):
+        results = await app.state.scheduler.submit("score", [(request.sentence1, request.sentence2)])
 
-    results = check_answer_similarity(score_model, request.sentence1, request.sentence2)
+    return results[0]
 
-    return results
+@app.post("/score-answers-batch")
+async def generate_batch_scores_api(request: AnswerBatchScoreRequest):
+    """ Score many answers
+
+    Score a whole quiz submission (or several) in one request.
+
+    JSON Fields:
+    ------------
+    `answers` (list): Objects with the `sentence1` golden answer and the `sentence2` user answer to evaluate.
+
+    Returns:
+    ____________
+    `results` (list): The prediction and probability of each given answer, in the same order as `answers`
+    """
+    sentence_pairs = [(answer.sentence1, answer.sentence2) for answer in request.answers]
+    with span("score"):
+        results = await app.state.scheduler.submit("score", sentence_pairs)
+
+    return {"results": results}
@@ -0,0 +1,195 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+import bisect
+import threading
+import time
+
+# Latency buckets in seconds, from tokenization (ms) to beam search on long documents (tens of s)
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256)
+
+
+class Metric:
+    """Base of the in-process metrics, one value per combination of label values"""
+    type = None
+
+    def __init__(self, name, documentation, labelnames=(), registry=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.values = {}
+        self.lock = threading.Lock()
+        (registry if registry is not None else REGISTRY).register(self)
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _format_labels(self, key, extra=()):
+        pairs = list(zip(self.labelnames, key)) + list(extra)
+        if not pairs:
+            return ""
+        escaped = [(name, value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")) for name, value in pairs]
+        return "{" + ",".join(f'{name}="{value}"' for name, value in escaped) + "}"
+
+    def samples(self):
+        """Returns (name suffix, label string, value) tuples"""
+        with self.lock:
+            return [("", self._format_labels(key), value) for key, value in sorted(self.values.items())]
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+        lines += [f"{self.name}{suffix}{labels} {format_value(value)}" for suffix, labels, value in self.samples()]
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def get(self, **labels):
+        with self.lock:
+            return self.values.get(self._key(labels), 0)
+
+
+class Gauge(Metric):
+    """A value that goes up and down. `set_function` reads it from a callable at scrape time instead"""
+    type = "gauge"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.function = None
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = value
+
+    def set_function(self, function):
+        self.function = function
+
+    def samples(self):
+        if self.function is not None:
+            return [("", "", self.function())]
+        return super().samples()
+
+
+class Histogram(Metric):
+    """Counts observations into cumulative buckets, with their sum and count"""
+    type = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS, registry=None):
+        super().__init__(name, documentation, labelnames, registry)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self.lock:
+            counts, total = self.values.get(key, ([0] * (len(self.buckets) + 1), 0.0))
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            self.values[key] = (counts, total + value)
+
+    def samples(self):
+        samples = []
+        with self.lock:
+            for key, (counts, total) in sorted(self.values.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets + (float("inf"),), counts):
+                    cumulative += count
+                    samples.append(("_bucket", self._format_labels(key, [("le", format_value(bound))]), cumulative))
+                samples.append(("_sum", self._format_labels(key), total))
+                samples.append(("_count", self._format_labels(key), cumulative))
+        return samples
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.metrics = []
+        self.lock = threading.Lock()
+
+    def register(self, metric):
+        with self.lock:
+            self.metrics.append(metric)
+
+    def render(self):
+        """Returns every metric in the Prometheus text exposition format"""
+        with self.lock:
+            metrics = list(self.metrics)
+        return "\n".join(metric.render() for metric in metrics) + "\n"
+
+def format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+REGISTRY = MetricsRegistry()
+
+STAGE_SECONDS = Histogram("quizachu_stage_seconds",
+                          "Time spent by a request in each stage (tokenize, generate, dedup, answer, select, score), queueing included",
+                          ["stage"])
+REQUEST_SECONDS = Histogram("quizachu_request_seconds", "Time to respond to a request", ["path", "method", "status"])
+MODEL_LOAD_SECONDS = Histogram("quizachu_model_load_seconds", "Time to load a model", ["model"])
+BATCH_SECONDS = Histogram("quizachu_batch_seconds", "Time to run one batch of model work", ["kind"])
+BATCH_SIZE = Histogram("quizachu_batch_size", "Number of requests' payloads run in one batch", ["kind"], buckets=SIZE_BUCKETS)
+QUEUE_WAIT_SECONDS = Histogram("quizachu_queue_wait_seconds", "Time model work waits in the scheduler queue", ["kind"])
+QUEUE_DEPTH = Gauge("quizachu_scheduler_queue_depth", "Model work waiting in the scheduler queue")
+CACHE_LOOKUPS = Counter("quizachu_cache_lookups_total", "Result cache lookups", ["namespace", "result"])
+SINGLE_FLIGHT_REQUESTS = Counter("quizachu_single_flight_requests_total",
+                                 "Requests that computed a result (leader) or awaited an identical one in flight (follower)",
+                                 ["endpoint", "role"])
+SINGLE_FLIGHT_IN_FLIGHT = Gauge("quizachu_single_flight_in_flight", "Distinct requests being computed")
+QUESTIONS_DEDUPLICATED = Counter("quizachu_questions_deduplicated_total", "Generated questions dropped as duplicates before answering")
+EARLY_STOP_CHUNKS_SKIPPED = Counter("quizachu_early_stop_chunks_skipped_total",
+                                    "Chunks of long contexts not processed because the selection was already complete",
+                                    ["policy"])
+
+
+# Stages timed while handling the current request, for its Server-Timing header
+request_timings = ContextVar("request_timings", default=None)
+
+class Span:
+    def __init__(self, stage):
+        self.stage = stage
+        self.duration = None
+
+@contextmanager
+def span(stage):
+    """Times a stage of the current request into quizachu_stage_seconds (and its Server-Timing header)"""
+    current = Span(stage)
+    start = time.perf_counter()
+    try:
+        yield current
+    finally:
+        current.duration = time.perf_counter() - start
+        STAGE_SECONDS.observe(current.duration, stage=stage)
+        timings = request_timings.get()
+        if timings is not None:
+            timings.append((stage, current.duration))
+
+@contextmanager
+def timed(histogram, **labels):
+    """Observes the duration of the block into `histogram`"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        histogram.observe(time.perf_counter() - start, **labels)
+
+def server_timing_header(timings, total=None):
+    """Formats (stage, seconds) pairs as a Server-Timing header value, in milliseconds
+    Stages timed more than once (e.g. once per chunk) are summed"""
+    durations = {}
+    for stage, duration in timings:
+        durations[stage] = durations.get(stage, 0.0) + duration
+    if total is not None:
+        durations["total"] = total
+    return ", ".join(f"{stage};dur={duration * 1000:.1f}" for stage, duration in durations.items())
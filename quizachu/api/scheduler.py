@@ -0,0 +1,123 @@
+from quizachu.api.metrics import BATCH_SECONDS, BATCH_SIZE, QUEUE_WAIT_SECONDS
+
+import asyncio
+import queue
+import threading
+import time
+
+
+class BatchScheduler:
+    """Collects model work from concurrent requests and runs it in batches on worker threads.
+
+    Args:
+        handlers: Dict mapping a kind of work (e.g. "generate") to a function that takes
+            a list of payloads and returns a list of results in the same order.
+        max_wait: Seconds to keep collecting work after the first item of a batch arrives.
+        max_batch_size: Maximum number of payloads handed to a handler at once.
+
+    Requests `await scheduler.submit(kind, payload)` from the event loop, which stays free
+    to serve other requests while inference runs. Every kind of work has its own queue and
+    worker thread (its lane), so that batches of different models run at the same time, e.g.
+    questions of one chunk are answered while the next chunk's questions are generated.
+
+    Batch sizes, queue waits and batch run times are recorded in `quizachu.api.metrics`.
+    """
+
+    def __init__(self, handlers, max_wait=0.01, max_batch_size=32):
+        self.handlers = handlers
+        self.max_wait = max_wait
+        self.max_batch_size = max_batch_size
+        self.queues = {kind: queue.Queue() for kind in handlers}
+        self.threads = {}
+        self.lock = threading.Lock()
+
+    def start(self):
+        with self.lock:
+            for kind, kind_queue in self.queues.items():
+                thread = self.threads.get(kind)
+                if thread is None or not thread.is_alive():
+                    self.threads[kind] = threading.Thread(target=self._run, args=(kind, kind_queue),
+                                                          name=f"batch-scheduler-{kind}", daemon=True)
+                    self.threads[kind].start()
+
+    def stop(self):
+        with self.lock:
+            threads, self.threads = self.threads, {}
+        for kind, thread in threads.items():
+            self.queues[kind].put(None)
+        for thread in threads.values():
+            thread.join()
+
+    def qsize(self):
+        """Number of payloads waiting in every lane"""
+        return sum(kind_queue.qsize() for kind_queue in self.queues.values())
+
+    async def submit(self, kind, payload):
+        """Queue `payload` for the `kind` handler and wait for its result."""
+        if kind not in self.handlers:
+            raise KeyError(f"No handler registered for {kind!r}")
+        self.start()
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self.queues[kind].put((payload, loop, future, time.perf_counter()))
+        return await future
+
+    def _collect(self, kind_queue):
+        # Block for the first item, then gather more until the wait window closes
+        first = kind_queue.get()
+        if first is None:
+            return None, True
+        batch = [first]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                item = kind_queue.get(timeout=timeout)
+            except queue.Empty:
+                break
+            if item is None:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    def _run(self, kind, kind_queue):
+        stopping = False
+        while not stopping:
+            batch, stopping = self._collect(kind_queue)
+            if batch:
+                self._run_group(kind, batch)
+
+    def _run_group(self, kind, items):
+        start = time.perf_counter()
+        BATCH_SIZE.observe(len(items), kind=kind)
+        for _, _, _, queued_at in items:
+            QUEUE_WAIT_SECONDS.observe(start - queued_at, kind=kind)
+
+        try:
+            results = self.handlers[kind]([payload for payload, _, _, _ in items])
+        except Exception as e:
+            BATCH_SECONDS.observe(time.perf_counter() - start, kind=kind)
+            self._resolve(items, exception=e)
+            return
+        BATCH_SECONDS.observe(time.perf_counter() - start, kind=kind)
+        self._resolve(items, results=results)
+
+    def _resolve(self, items, results=None, exception=None):
+        if exception is not None:
+            for _, loop, request_future, _ in items:
+                loop.call_soon_threadsafe(_set_exception, request_future, exception)
+            return
+
+        for (_, loop, request_future, _), result in zip(items, results):
+            loop.call_soon_threadsafe(_set_result, request_future, result)
+
+
+def _set_result(future, result):
+    if not future.done():
+        future.set_result(result)
+
+def _set_exception(future, exception):
+    if not future.done():
+        future.set_exception(exception)
@@ -0,0 +1,113 @@
+from quizachu.cache import normalize_context
+from collections import OrderedDict
+
+import hashlib
+import threading
+import time
+
+
+class ContextSession:
+    """A document uploaded once and referenced by `context_id` in later requests.
+
+    Holds what can be reused across requests on the same document: the question generation
+    plan (tokenized windows of the document) once computed, and the answers already found
+    for each question, at most `max_answers` of them (the least recently used are dropped).
+    """
+
+    def __init__(self, context_id, context, max_answers=1024):
+        self.context_id = context_id
+        self.context = context
+        self.plan = None
+        self.answers = OrderedDict()
+        self.max_answers = max_answers
+        self.created = time.monotonic()
+        self.last_used = self.created
+        self.lock = threading.Lock()
+
+    def get_plan(self, compute):
+        """Returns the question generation plan, computing it with `compute(context)` on first use"""
+        with self.lock:
+            if self.plan is None:
+                self.plan = compute(self.context)
+            return self.plan
+
+    def get_answers(self, questions):
+        with self.lock:
+            rows = []
+            for question in questions:
+                row = self.answers.get(question)
+                if row is not None:
+                    self.answers.move_to_end(question)
+                rows.append(row)
+            return rows
+
+    def set_answers(self, rows):
+        with self.lock:
+            for row in rows:
+                self.answers[row["question"]] = row
+                self.answers.move_to_end(row["question"])
+            while len(self.answers) > self.max_answers:
+                self.answers.popitem(last=False)
+
+
+class ContextStore:
+    """Keeps context sessions for `ttl` seconds after their last use, and at most `max_sessions` of them,
+    each with at most `max_answers` answered questions
+
+    The `context_id` is the digest of the normalized document, so uploading the same text
+    twice returns the same session. The least recently used sessions are evicted first.
+    """
+
+    def __init__(self, max_sessions=256, ttl=3600, max_answers=1024):
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self.max_answers = max_answers
+        self.sessions = OrderedDict()
+        self.lock = threading.Lock()
+        self.evictions = 0
+
+    def create(self, context):
+        context_id = hashlib.sha256(normalize_context(context).encode("utf-8")).hexdigest()[:32]
+        with self.lock:
+            self._expire()
+            session = self.sessions.get(context_id)
+            if session is None:
+                session = self.sessions[context_id] = ContextSession(context_id, context, self.max_answers)
+            session.last_used = time.monotonic()
+            self.sessions.move_to_end(context_id)
+            while len(self.sessions) > self.max_sessions:
+                self.sessions.popitem(last=False)
+                self.evictions += 1
+        return session
+
+    def get(self, context_id):
+        """Returns the session, or None if it is unknown or has expired"""
+        with self.lock:
+            self._expire()
+            session = self.sessions.get(context_id)
+            if session is not None:
+                session.last_used = time.monotonic()
+                self.sessions.move_to_end(context_id)
+            return session
+
+    def delete(self, context_id):
+        with self.lock:
+            return self.sessions.pop(context_id, None) is not None
+
+    def expires_in(self, session):
+        return max(self.ttl - (time.monotonic() - session.last_used), 0)
+
+    def stats(self):
+        with self.lock:
+            return {"sessions": len(self.sessions), "max_sessions": self.max_sessions,
+                    "ttl_s": self.ttl, "evictions": self.evictions}
+
+    def _expire(self):
+        # Sessions are kept in order of last use, so expired ones are at the front
+        now = time.monotonic()
+        while self.sessions:
+            context_id, session = next(iter(self.sessions.items()))
+            if now - session.last_used < self.ttl:
+                break
+            del self.sessions[context_id]
+            self.evictions += 1
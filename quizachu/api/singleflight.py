@@ -0,0 +1,58 @@
+from quizachu.api.metrics import SINGLE_FLIGHT_REQUESTS, SINGLE_FLIGHT_IN_FLIGHT
+from quizachu.cache import normalize_context
+
+import asyncio
+import copy
+import hashlib
+import json
+
+
+def request_key(endpoint, body):
+    """Canonical key of a request: its endpoint and JSON body, with sorted fields and the
+    whitespace of `context` normalized like the result cache does"""
+    body = dict(body)
+    if body.get("context") is not None:
+        body["context"] = normalize_context(body["context"])
+    payload = json.dumps({"endpoint": endpoint, "body": body}, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class SingleFlight:
+    """Coalesces identical requests while they are in flight.
+
+    The first request with a key runs the computation; requests with the same key arriving
+    before it finishes await the same task and get a copy of its result (or its exception).
+    Nothing is kept once the task is done, so unlike the result cache this only merges
+    concurrent work, and applies even when caching is disabled.
+
+    The shared task is shielded, so a client disconnecting does not cancel it for the others.
+    """
+
+    def __init__(self):
+        self.in_flight = {}
+
+    async def run(self, endpoint, body, compute):
+        """Returns the result of `compute()` (a coroutine function), shared by concurrent calls
+        to `endpoint` with the same request `body` (a dict)"""
+        key = request_key(endpoint, body)
+        task = self.in_flight.get(key)
+        if task is not None:
+            SINGLE_FLIGHT_REQUESTS.inc(endpoint=endpoint, role="follower")
+            # Followers get their own copy, in case a caller modifies the result
+            return copy.deepcopy(await asyncio.shield(task))
+
+        SINGLE_FLIGHT_REQUESTS.inc(endpoint=endpoint, role="leader")
+        task = asyncio.ensure_future(compute())
+        self.in_flight[key] = task
+        SINGLE_FLIGHT_IN_FLIGHT.set(len(self.in_flight))
+
+        def forget(done):
+            if self.in_flight.get(key) is done:
+                del self.in_flight[key]
+            SINGLE_FLIGHT_IN_FLIGHT.set(len(self.in_flight))
+            # Retrieve the exception when every caller went away, so it is not reported as never retrieved
+            if not done.cancelled():
+                done.exception()
+        task.add_done_callback(forget)
+
+        return await asyncio.shield(task)
@@ -0,0 +1,202 @@
+"""Offline quiz generation over a corpus of documents
+
+Streams documents from a directory of text files or from a JSONL file, runs them through
+the same generate -> dedup -> answer -> select pipeline as /generate-questions-and-answers,
+and appends one quiz per document to a JSONL file or to Parquet part files.
+
+Documents are processed in batches: the chunks of every document in a batch go through
+shared generate calls, and all of their questions through one QA pipeline call. After each
+batch, its results are flushed to disk and a checkpoint records the documents done, so an
+interrupted run started again with the same arguments resumes after the last batch written.
+
+Usage:
+    python -m quizachu.batch --input docs/ --output quizzes.jsonl
+    python -m quizachu.batch --input requests.jsonl --text-field body --id-field request_id \\
+                             --output quizzes/ --format parquet
+"""
+from quizachu.params import *
+from quizachu.chunking import plan_question_generation
+from quizachu.generate.model import generate_questions_batch
+from quizachu.generate.planner import default_plan
+from quizachu.generate.dedup import QuestionDeduplicator
+from quizachu.answer.model import answer_question_context_pairs, select_top_n_answered_questions
+from pathlib import Path
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import tempfile
+import time
+import more_itertools as mit
+import pandas as pd
+
+
+def iter_documents(path, text_field="context", id_field="id", pattern="*"):
+    """Yields (document id, text) pairs from a JSONL file or the files of a directory
+    Files are read in sorted order and identified by their path relative to the directory,
+    JSONL lines by `id_field` (or their line number when it is missing)"""
+    path = Path(path)
+    if path.is_dir():
+        for file in sorted(p for p in path.rglob(pattern) if p.is_file()):
+            yield file.relative_to(path).as_posix(), file.read_text(encoding="utf-8", errors="ignore")
+        return
+
+    with open(path, encoding="utf-8") as f:
+        for line_number, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            yield str(record.get(id_field, line_number)), record[text_field]
+
+
+class Checkpoint:
+    """Records the documents already written, and where the output ended after the last batch"""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.done = set()
+        self.output_bytes = 0
+        self.parts = 0
+        if self.path.exists():
+            state = json.loads(self.path.read_text())
+            self.done = set(state["done"])
+            self.output_bytes = state["output_bytes"]
+            self.parts = state["parts"]
+
+    def save(self):
+        # Write then rename, so a crash never leaves a half-written checkpoint
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.path.parent, prefix=f".{self.path.name}.", suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            json.dump({"done": sorted(self.done), "output_bytes": self.output_bytes, "parts": self.parts}, f)
+        os.replace(tmp_path, self.path)
+
+
+class JsonlWriter:
+    def __init__(self, path, checkpoint):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        # Drop anything written after the last checkpoint (a batch interrupted half way)
+        with open(self.path, "a+b") as f:
+            f.truncate(checkpoint.output_bytes)
+        self.checkpoint = checkpoint
+
+    def write(self, records):
+        with open(self.path, "ab") as f:
+            for record in records:
+                f.write((json.dumps(record) + "\n").encode("utf-8"))
+            f.flush()
+            os.fsync(f.fileno())
+            self.checkpoint.output_bytes = f.tell()
+
+
+class ParquetWriter:
+    """Writes each batch to its own part file, one row per question"""
+
+    def __init__(self, path, checkpoint):
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.checkpoint = checkpoint
+
+    def write(self, records):
+        rows = [{"id": record["id"], "question_number": i, **question}
+                for record in records for i, question in enumerate(record["questions"])]
+        data = pd.DataFrame(rows, columns=["id", "question_number", "question", "answer", "confidence"])
+        part = self.path / f"part-{self.checkpoint.parts:05d}.parquet"
+        data.to_parquet(part.with_suffix(".tmp"), index=False)
+        os.replace(part.with_suffix(".tmp"), part)
+        self.checkpoint.parts += 1
+
+
+def generate_quizzes(generate_model, generate_tokenizer, question_answerer, documents, dedup=QUESTION_DEDUP_ENABLED):
+    """Returns a quiz record for each (id, text) document, batching model work across documents"""
+    plans = [plan_question_generation(generate_tokenizer, text) for _, text in documents]
+
+    # Generate for the chunks of every document, in batches of chunks sharing the same number of questions
+    # (all the chunks of a document do, so each document's questions stay in chunk order)
+    by_count = {}
+    for d, (_, contexts, questions_per_context, _) in enumerate(plans):
+        by_count.setdefault(questions_per_context, []).extend((d, chunk) for chunk in contexts)
+
+    questions = [[] for _ in documents]
+    for questions_per_context, items in by_count.items():
+        for batch in mit.chunked(items, GENERATE_BATCH_SIZE):
+            generated = generate_questions_batch(generate_model, generate_tokenizer, [chunk for _, chunk in batch],
+                                                 plan=default_plan(questions_per_context))
+            for (d, _), chunk_questions in zip(batch, generated):
+                questions[d].extend(q for q in chunk_questions if q)
+
+    # Drop paraphrases of the same question within each document before answering
+    if dedup:
+        questions = [QuestionDeduplicator().add(document_questions) for document_questions in questions]
+
+    # Answer the questions of every document in one pipeline call
+    pairs = [(q, text) for (_, text), document_questions in zip(documents, questions) for q in document_questions]
+    rows = answer_question_context_pairs(question_answerer, [q for q, _ in pairs], [text for _, text in pairs])
+
+    records = []
+    start = 0
+    for (doc_id, _), document_questions, (n_questions, _, _, _) in zip(documents, questions, plans):
+        end = start + len(document_questions)
+        questions_answers = pd.DataFrame(rows[start:end], columns=['confidence', 'question', 'answer'])
+        start = end
+        # Silence the explanatory prints of the selector, one per document
+        with contextlib.redirect_stdout(io.StringIO()):
+            selected = select_top_n_answered_questions(questions_answers, c=0.05, n=n_questions, max_repeat_exact_answers=1)
+        records.append({"id": doc_id,
+                        "n_candidates": len(document_questions),
+                        "questions": [{"question": row["question"], "answer": row["answer"], "confidence": float(row["confidence"])}
+                                      for row in selected.to_dict("records")]})
+    return records
+
+def run(input_path, output_path, output_format="jsonl", text_field="context", id_field="id", pattern="*",
+        batch_documents=16, limit=None):
+    from quizachu.generate.model import create_generate_model, create_generate_tokenizer
+    from quizachu.answer.model import create_question_answerer
+
+    checkpoint = Checkpoint(f"{str(output_path).rstrip('/')}.checkpoint.json")
+    writer = (ParquetWriter if output_format == "parquet" else JsonlWriter)(output_path, checkpoint)
+    if checkpoint.done:
+        print(f"Resuming after {len(checkpoint.done)} documents already written")
+
+    generate_model, generate_tokenizer = create_generate_model(), create_generate_tokenizer()
+    question_answerer = create_question_answerer()
+
+    documents = ((doc_id, text) for doc_id, text in iter_documents(input_path, text_field, id_field, pattern)
+                 if doc_id not in checkpoint.done and text.strip())
+    if limit is not None:
+        documents = mit.take(limit, documents)
+
+    start = time.time()
+    n_done = 0
+    for batch in mit.chunked(documents, batch_documents):
+        records = generate_quizzes(generate_model, generate_tokenizer, question_answerer, batch)
+        writer.write(records)
+        checkpoint.done.update(record["id"] for record in records)
+        checkpoint.save()
+        n_done += len(batch)
+        print(f"✅ {n_done} documents done ({n_done / (time.time() - start):.2f} documents/s)")
+
+    print(f"✅ Quizzes for {n_done} documents written to {output_path} ({len(checkpoint.done)} in total)")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--input", required=True, help="directory of text files or JSONL file")
+    parser.add_argument("--output", required=True, help="JSONL file, or directory of Parquet part files")
+    parser.add_argument("--format", choices=["jsonl", "parquet"], default=None,
+                        help="output format (default: jsonl when --output ends in .jsonl, parquet otherwise)")
+    parser.add_argument("--text-field", default="context", help="JSONL field holding the document text")
+    parser.add_argument("--id-field", default="id", help="JSONL field identifying the document")
+    parser.add_argument("--glob", default="*", help="files to read from an input directory")
+    parser.add_argument("--batch-documents", type=int, default=16, help="documents processed together")
+    parser.add_argument("--limit", type=int, default=None, help="stop after this many new documents")
+    args = parser.parse_args()
+
+    output_format = args.format or ("jsonl" if Path(args.output).suffix in (".jsonl", ".ndjson") else "parquet")
+    run(args.input, args.output, output_format, args.text_field, args.id_field, args.glob,
+        args.batch_documents, args.limit)
+
+if __name__ == "__main__":
+    main()
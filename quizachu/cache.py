@@ -0,0 +1,125 @@
+from collections import OrderedDict
+from pathlib import Path
+
+import hashlib
+import json
+import os
+import pickle
+import tempfile
+import threading
+
+
+def normalize_context(context):
+    """Collapses runs of whitespace so resubmitted texts map to the same cache key"""
+    return " ".join(str(context).split())
+
+def make_cache_key(namespace, model_id, context, **params):
+    """Builds a content-addressed key from the normalized context, the identity of the
+    model weights and the parameters that affect the output"""
+    payload = json.dumps({"namespace": namespace,
+                          "model": model_id,
+                          "context": normalize_context(context),
+                          "params": params},
+                         sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResultCache:
+    """Two-tier cache for model outputs.
+
+    Args:
+        max_bytes: Memory budget of the LRU tier, measured on the pickled values.
+            The least recently used entries are evicted once it is exceeded.
+        directory: Optional directory for the on-disk tier. Every entry is also
+            written there, and memory misses fall back to it.
+
+    `stats()` reports hits and misses for both tiers.
+    """
+
+    def __init__(self, max_bytes=64 * 1024 * 1024, directory=None):
+        self.max_bytes = max_bytes
+        self.directory = Path(directory) if directory else None
+        self.entries = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return pickle.loads(self.entries[key])
+
+        data = self._read_disk(key)
+        with self.lock:
+            if data is None:
+                self.misses += 1
+                return default
+            self.disk_hits += 1
+            self._store(key, data)
+        return pickle.loads(data)
+
+    def set(self, key, value):
+        data = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        with self.lock:
+            self._store(key, data)
+        self._write_disk(key, data)
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {"hits": self.hits,
+                    "disk_hits": self.disk_hits,
+                    "misses": self.misses,
+                    "hit_rate": (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+                    "entries": len(self.entries),
+                    "bytes": self.size,
+                    "max_bytes": self.max_bytes,
+                    "evictions": self.evictions}
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+    def _store(self, key, data):
+        # Values are kept pickled, so cached results can never be mutated by callers
+        if len(data) > self.max_bytes:
+            return
+        if key in self.entries:
+            self.size -= len(self.entries.pop(key))
+        self.entries[key] = data
+        self.size += len(data)
+        while self.size > self.max_bytes:
+            _, evicted = self.entries.popitem(last=False)
+            self.size -= len(evicted)
+            self.evictions += 1
+
+    def _disk_path(self, key):
+        return self.directory / key[:2] / f"{key}.pkl"
+
+    def _read_disk(self, key):
+        if self.directory is None:
+            return None
+        try:
+            return self._disk_path(key).read_bytes()
+        except OSError:
+            return None
+
+    def _write_disk(self, key, data):
+        if self.directory is None:
+            return
+        path = self._disk_path(key)
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            # Write to a temporary file first so readers never see a partial entry
+            fd, tmp_path = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"\n❌ Could not write cache entry {key}: {e!r}")
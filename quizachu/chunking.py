@@ -0,0 +1,122 @@
+from quizachu.params import GENERATE_MAX_INPUT_TOKENS, GENERATE_CHUNK_OVERLAP, GENERATE_BATCH_SIZE, PIPELINE_CHUNK_GROUP
+from quizachu.utils import get_available_cpus
+from typing import NamedTuple
+from collections import deque
+
+import math
+
+
+class ContextChunk(NamedTuple):
+    """A window of the source text, with its position in characters and in tokens"""
+    text: str
+    start_char: int
+    end_char: int
+    start_token: int
+    end_token: int
+
+
+class TokenizedContext(NamedTuple):
+    """A text tokenized once, without special tokens, with the character span of every token"""
+    text: str
+    input_ids: list
+    offsets: list
+
+    def __len__(self):
+        return len(self.input_ids)
+
+
+def tokenize_context(tokenizer, context):
+    """Tokenizes `context` with a fast (Rust) tokenizer, keeping the offset mapping back to the text"""
+    encoded = tokenizer(context, add_special_tokens=False, return_offsets_mapping=True)
+    return TokenizedContext(context, encoded["input_ids"], encoded["offset_mapping"])
+
+def chunk_tokenized_context(tokenized, width, stride):
+    """Splits a tokenized context into overlapping windows of at most `width` tokens,
+    starting every `stride` tokens, until the end of the text is covered
+
+    Each chunk's text is the exact slice of the source spanned by its tokens, so no token
+    is cut in half and no padding is added."""
+    if width <= 0 or stride <= 0:
+        raise ValueError(f"width and stride must be positive, got {width} and {stride}")
+
+    n_tokens = len(tokenized)
+    chunks = []
+    for start in range(0, max(n_tokens, 1), stride):
+        end = min(start + width, n_tokens)
+        if end <= start:
+            break
+        start_char = tokenized.offsets[start][0]
+        end_char = tokenized.offsets[end - 1][1]
+        chunks.append(ContextChunk(tokenized.text[start_char:end_char], start_char, end_char, start, end))
+        if end == n_tokens:
+            break
+    return chunks
+
+def chunk_context(tokenizer, context, width, stride):
+    """Tokenizes `context` once and returns its overlapping token windows"""
+    return chunk_tokenized_context(tokenize_context(tokenizer, context), width, stride)
+
+def coverage_order(n_chunks):
+    """Returns the indices of `n_chunks` chunks, ordered to spread over the text as early as possible:
+    first and last chunk, then the middle one, then the middles of each half, and so on
+    (so stopping after any number of chunks leaves no large part of the text unseen)"""
+    if n_chunks <= 2:
+        return list(range(n_chunks))
+    order = [0, n_chunks - 1]
+    intervals = deque([(0, n_chunks - 1)])
+    while intervals:
+        low, high = intervals.popleft()
+        middle = (low + high) // 2
+        if middle == low:
+            continue
+        order.append(middle)
+        intervals.append((low, middle))
+        intervals.append((middle, high))
+    return order
+
+def pipeline_chunk_group(n_chunks, chunk_group=PIPELINE_CHUNK_GROUP, batch_size=GENERATE_BATCH_SIZE, n_cpus=None):
+    """Returns the number of chunks generated per step of the generate/answer pipeline
+
+    `chunk_group` if set. Otherwise half of the chunks (rounded up) and at most a generate batch,
+    so that answering the questions of the first group overlaps with generating the second one.
+    On a single CPU both models compete for it, so there is nothing to overlap and the chunks
+    are generated in full batches."""
+    if chunk_group > 0:
+        return chunk_group
+    if (n_cpus or get_available_cpus()) < 2:
+        return batch_size
+    return max(1, min(batch_size, math.ceil(n_chunks / 2)))
+
+def plan_question_generation(tokenizer, context, max_input_tokens=GENERATE_MAX_INPUT_TOKENS,
+                             overlap=GENERATE_CHUNK_OVERLAP):
+    """Decides how many questions to return for `context` and how to generate candidates
+    Returns `n_questions`, the list of contexts to generate from, the number of questions per context
+    and the number of tokens of each context"""
+    context_length = len(context.split())
+
+    # Scale the number of questions/answers returned according to the context length
+    # Add another question per 150 words of context
+    n_questions = 4 + context_length // 150
+    # Generate 4 candidates per question returned, for the QA filter to choose from
+    n_candidates = n_questions * 4
+
+    # Tokenize once with the generate tokenizer, keeping one token for the end of sequence
+    tokenized = tokenize_context(tokenizer, context)
+    max_tokens = max_input_tokens - 1
+
+    # If the context fits in the flan-t5 window, pass whole context to question generation
+    if len(tokenized) <= max_tokens:
+        return n_questions, [context], n_candidates, [len(tokenized)]
+
+    # Otherwise, split into the fewest full windows that cover the context with at least `overlap`
+    # tokens shared by consecutive windows, spread evenly over the text
+    overlap = min(overlap, max_tokens // 2)
+    n_chunks = math.ceil((len(tokenized) - overlap) / (max_tokens - overlap))
+    stride = math.ceil((len(tokenized) - max_tokens) / (n_chunks - 1))
+    # Each chunk is the exact slice of the context covered by its tokens
+    chunks = chunk_tokenized_context(tokenized, width=max_tokens, stride=stride)
+
+    # Share the candidates between the chunks
+    questions_per_context = math.ceil(n_candidates / len(chunks))
+    return n_questions, [chunk.text for chunk in chunks], questions_per_context, \
+        [chunk.end_token - chunk.start_token for chunk in chunks]
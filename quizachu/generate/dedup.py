@@ -0,0 +1,167 @@
+from quizachu.params import *
+from quizachu.lazy import lazy_import
+
+import re
+import zlib
+
+np = lazy_import("numpy")
+
+# Words that do not change what a question asks about
+STOP_WORDS = frozenset("""a an the of in on at to for from by with about as into and or is are was were be been
+do does did has have had what which who whom whose when where why how that this these those it its
+there their they he she his her""".split())
+
+# Common verbs generated questions use interchangeably, mapped to one of them
+SYNONYM_GROUPS = ["start starts started starting begin begins began begun beginning commence commenced",
+                  "end ends ended ending finish finished conclude concluded",
+                  "found founded establish established create created",
+                  "make makes made build builds built",
+                  "die dies died pass passed",
+                  "win wins won defeat defeated beat"]
+SYNONYMS = {word: group.split()[0] for group in SYNONYM_GROUPS for word in group.split()}
+
+# Stop words that still tell apart what a question asks
+QUESTION_WORDS = frozenset("what which who whom whose when where why how".split())
+
+
+def normalize_question(question):
+    """Lowercases, strips punctuation and maps synonyms to one word, so questions
+    differing only in those compare equal"""
+    words = re.sub(r"[^\w\s]", " ", str(question).lower()).split()
+    return " ".join(SYNONYMS.get(word, word) for word in words)
+
+def content_words(text):
+    """The set of words of a normalized question other than stop words and numbers"""
+    return frozenset(word for word in text.split() if word not in STOP_WORDS and not word.isdigit())
+
+def key_words(text):
+    """A normalized question without its stop words, question words excepted"""
+    return " ".join(word for word in text.split() if word not in STOP_WORDS or word in QUESTION_WORDS)
+
+def numbers(text):
+    """The set of numbers of a normalized question"""
+    return frozenset(word for word in text.split() if word.isdigit())
+
+def content_overlap(a, b):
+    """Jaccard overlap between the rows of two (n, d) 0/1 matrices of hashed content words"""
+    intersection = a @ b.T
+    union = a.sum(axis=1)[:, None] + b.sum(axis=1)[None, :] - intersection
+    # Questions of stop words only have nothing to tell them apart
+    return np.where(union > 0, intersection / np.maximum(union, 1), 1.0)
+
+def hash_content_words(texts, dim=1024):
+    content = np.zeros((len(texts), dim), dtype=np.float32)
+    for i, text in enumerate(texts):
+        for word in content_words(text):
+            content[i, zlib.crc32(word.encode("utf-8")) % dim] = 1.0
+    return content
+
+def hashed_features(text, n_chars=3):
+    """Words, word bigrams and character n-grams of a normalized question"""
+    words = text.split()
+    features = words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+    padded = f" {text} "
+    features += [padded[i:i + n_chars] for i in range(len(padded) - n_chars + 1)]
+    return features
+
+def embed_questions(questions, dim=4096):
+    """Embeds questions in one (n, dim) matrix of L2-normalized hashed n-gram counts
+
+    Questions generated from overlapping chunks of the same text mostly paraphrase each
+    other with the same words, which these features capture without running a model.
+    Stop words other than question words are left out, as paraphrases often differ in those."""
+    rows, columns = [], []
+    for i, question in enumerate(questions):
+        for feature in hashed_features(key_words(normalize_question(question))):
+            rows.append(i)
+            columns.append(zlib.crc32(feature.encode("utf-8")) % dim)
+
+    embeddings = np.zeros((len(questions), dim), dtype=np.float32)
+    np.add.at(embeddings, (np.array(rows, dtype=np.intp), np.array(columns, dtype=np.intp)), 1.0)
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    return embeddings / np.maximum(norms, 1e-12)
+
+
+class QuestionDeduplicator:
+    """Suppresses near-duplicate questions before they are answered.
+
+    Args:
+        threshold: Cosine similarity above which a question is a duplicate of one already kept.
+        min_overlap: Jaccard overlap of their content words a duplicate must also have.
+        embed: Function embedding a list of questions into an (n, d) array of unit vectors.
+        block_size: Number of questions compared at once, to bound the similarity matrix in memory.
+
+    Exact duplicates (after normalization) are dropped first. The remaining questions are
+    embedded in one batch, and each one is kept only if it is not too similar to a question
+    kept before it, in input order (so the first, most likely, phrasing is kept).
+    Similar questions asking about different things ("When was the republic founded?" and
+    "... dissolved?", "... in 1815?" and "... in 1850?") differ by little more than a word,
+    so a question is only a duplicate of one with the same numbers and at least `min_overlap`
+    of its content words (after mapping common synonyms to one word).
+    `add` can be called once per chunk, and compares against everything kept so far.
+    """
+
+    def __init__(self, threshold=QUESTION_DEDUP_THRESHOLD, embed=embed_questions, block_size=512,
+                 min_overlap=QUESTION_DEDUP_MIN_OVERLAP):
+        self.threshold = threshold
+        self.min_overlap = min_overlap
+        self.embed = embed
+        self.block_size = block_size
+        self.seen = set()
+        self.kept = None
+        self.kept_content = None
+        # Ids of the numbers of the kept questions, one id per distinct set
+        self.number_ids = {}
+        self.kept_numbers = None
+        self.suppressed = 0
+
+    def add(self, questions):
+        """Returns the questions of `questions` that are not near-duplicates, in order"""
+        candidates = []
+        for question in questions:
+            key = normalize_question(question)
+            if key and key not in self.seen:
+                self.seen.add(key)
+                candidates.append(question)
+        self.suppressed += len(questions) - len(candidates)
+        if not candidates:
+            return []
+
+        embeddings = self.embed(candidates)
+        texts = [normalize_question(question) for question in candidates]
+        content = hash_content_words(texts)
+        number_ids = np.array([self.number_ids.setdefault(numbers(text), len(self.number_ids)) for text in texts],
+                              dtype=np.intp)
+        keep = np.ones(len(candidates), dtype=bool)
+
+        def duplicates(block, embeddings_to, content_to, numbers_to):
+            return (embeddings[block] @ embeddings_to.T >= self.threshold) & \
+                (content_overlap(content[block], content_to) >= self.min_overlap) & \
+                (number_ids[block, None] == numbers_to[None, :])
+
+        # Questions too close to one kept from earlier calls
+        if self.kept is not None and len(self.kept):
+            for start in range(0, len(candidates), self.block_size):
+                block = slice(start, start + self.block_size)
+                keep[block] = ~duplicates(block, self.kept, self.kept_content, self.kept_numbers).any(axis=1)
+
+        # Greedy pass within the batch: a question suppresses the later ones it is too close to
+        for start in range(0, len(candidates), self.block_size):
+            end = min(start + self.block_size, len(candidates))
+            similar = duplicates(slice(start, end), embeddings, content, number_ids)
+            for i in range(start, end):
+                if keep[i]:
+                    later = similar[i - start, i + 1:]
+                    keep[i + 1:][later] = False
+
+        self.suppressed += int((~keep).sum())
+        new = embeddings[keep]
+        self.kept = new if self.kept is None else np.concatenate([self.kept, new])
+        self.kept_content = content[keep] if self.kept_content is None else np.concatenate([self.kept_content, content[keep]])
+        self.kept_numbers = number_ids[keep] if self.kept_numbers is None else np.concatenate([self.kept_numbers, number_ids[keep]])
+        return [question for question, k in zip(candidates, keep) if k]
+
+def deduplicate_questions(questions, threshold=QUESTION_DEDUP_THRESHOLD, embed=embed_questions,
+                          min_overlap=QUESTION_DEDUP_MIN_OVERLAP):
+    """Returns `questions` without exact and near-duplicates, keeping the first of each group"""
+    return QuestionDeduplicator(threshold, embed, min_overlap=min_overlap).add(questions)
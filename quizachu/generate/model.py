@@ -1,4 +1,5 @@
 from quizachu.registry import *
+from quizachu.generate.planner import default_plan
 
 test_context = """
 The history of the Netherlands extends back long before the founding of the modern Kingdom of the Netherlands in 1815 after the defeat of Napoleon. For thousands of years, people have been living together around the river deltas of this section of the North Sea coast. Records begin with the four centuries during which the region formed a militarized border zone of the Roman Empire. As the Western Roman Empire collapsed and the Middle Ages began, three dominant Germanic peoples coalesced in the area – Frisians in the north and coastal areas, Low Saxons in the northeast, in addition to the Franks in the south. By 800, the Frankish Carolingian dynasty had once again integrated the area into an empire covering a large part of Western Europe. The region was part of the duchy of Lower Lotharingia within the Holy Roman Empire, but neither the empire nor the duchy were governed in a centralized manner. For several centuries, medieval lordships such as Brabant, Holland, Zeeland, Friesland, Guelders and others held a changing patchwork of territories.
@@ -21,29 +22,43 @@ def update_weights(model, weights_path):
     model.load_weights(weights_path)
     return model
 
-def create_generate_model():
+def create_tf_generate_model(weights_path=None):
+    """Loads the fine-tuned weights at `weights_path` (the latest ones from the model store by default)"""
     model = initialize_generate_model()
-    weights_path = get_generate_weights_path()
+    weights_path = weights_path or get_generate_weights_path()
     # Add fine-tuned weights from GCS or local cache
     model = update_weights(model, weights_path)
     return model
 
-def generate_questions(model, tokenizer, context, n_questions=20):
-    tokens = tokenizer(context, return_tensors="tf").input_ids
+def create_generate_model(weights_path=None):
+    # The quantized ONNX Runtime backend is exported from the same fine-tuned weights
+    if GENERATE_BACKEND == "onnx":
+        from quizachu.generate.onnx_backend import create_onnx_generate_model
+        return create_onnx_generate_model(weights_path=weights_path)
+    return create_tf_generate_model(weights_path)
+
+def generate_questions(model, tokenizer, context, n_questions=20, plan=None):
+    return generate_questions_batch(model, tokenizer, [context], n_questions, plan)[0]
+
+def generate_questions_batch(model, tokenizer, contexts, n_questions=20, plan=None):
+    """Generates `n_questions` questions for each context in `contexts`
+    The contexts are padded into a single batch and passed to one `model.generate` call
+    `plan` sets the beam search/sampling configuration (diverse beam search by default)
+    Returns a list of question lists, in the same order as `contexts`"""
+    plan = plan or default_plan(n_questions)
+    n_questions = plan.n_questions
+
+    # TF models take TF tensors, ONNX Runtime models (which use the PyTorch generate loop) take PyTorch tensors
+    return_tensors = "tf" if type(model).__name__.startswith("TF") else "pt"
+    tokens = tokenizer(contexts, return_tensors=return_tensors, padding=True)
     generated_tokens = model.generate(
-        tokens,
-        do_sample=False,
-        num_return_sequences=n_questions,
-        num_beams=n_questions,
-        num_beam_groups=n_questions,
-        diversity_penalty=10.0,
-        no_repeat_ngram_size=2,
-        repetition_penalty=2.0
+        tokens.input_ids,
+        attention_mask=tokens.attention_mask,
+        **plan.generate_kwargs()
     )
-    questions = []
-    for i in range(n_questions):
-        questions.append(tokenizer.decode(generated_tokens[i], skip_special_tokens=True))
-    return questions
+    # Sequences are returned grouped by context, n_questions at a time
+    questions = tokenizer.batch_decode(generated_tokens, skip_special_tokens=True)
+    return [questions[i:i + n_questions] for i in range(0, len(questions), n_questions)]
 
 if __name__ == "__main__":
     model = create_generate_model()
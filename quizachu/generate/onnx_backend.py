@@ -0,0 +1,147 @@
+"""int8 quantized ONNX Runtime backend for the question generator
+
+The fine-tuned `generate-production.h5` weights are exported once to ONNX (encoder, decoder
+and decoder-with-past, so the decoder loop reuses its KV cache), dynamically quantized to
+int8 and saved to ONNX_GENERATE_MODEL_PATH. Select it with GENERATE_BACKEND=onnx.
+Each version of the weights gets its own export directory, so new weights are exported again.
+
+Exporting needs `optimum[onnxruntime]` and PyTorch next to TensorFlow; serving only needs
+`optimum[onnxruntime]` and PyTorch.
+
+Run this module to export the model (if needed) and compare it with the TF model:
+    python -m quizachu.generate.onnx_backend
+"""
+from quizachu.generate.model import create_tf_generate_model, create_generate_tokenizer, generate_questions, test_context
+from quizachu.params import ONNX_GENERATE_MODEL_PATH, ONNX_QUANTIZATION_TARGET
+from quizachu.registry import get_generate_weights_path, get_model_id
+from quizachu.utils import get_rss_mb, file_lock
+
+import hashlib
+import os
+import shutil
+import statistics
+import tempfile
+import time
+
+ONNX_FILE_NAMES = ["encoder_model.onnx", "decoder_model.onnx", "decoder_with_past_model.onnx"]
+EXPORT_PREFIX = "weights-"
+
+def quantized_file_name(file_name):
+    return file_name.replace(".onnx", "_quantized.onnx")
+
+def export_dir_name(weights_path):
+    """Name of the export directory of the weights at `weights_path`, derived from their model id"""
+    return EXPORT_PREFIX + hashlib.sha256(get_model_id(weights_path).encode("utf-8")).hexdigest()[:16]
+
+def export_onnx_generate_model(output_dir=ONNX_GENERATE_MODEL_PATH, weights_path=None):
+    """Exports the fine-tuned TF generator to ONNX and quantizes it to int8 in `output_dir`"""
+    weights_path = weights_path or get_generate_weights_path()
+    from transformers import T5ForConditionalGeneration
+    from optimum.onnxruntime import ORTModelForSeq2SeqLM, ORTQuantizer
+    from optimum.onnxruntime.configuration import AutoQuantizationConfig
+
+    tokenizer = create_generate_tokenizer()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        # The ONNX exporter works from PyTorch, so convert the fine-tuned TF weights first
+        tf_dir = os.path.join(tmp_dir, "tf")
+        create_tf_generate_model(weights_path).save_pretrained(tf_dir)
+        pt_dir = os.path.join(tmp_dir, "pt")
+        T5ForConditionalGeneration.from_pretrained(tf_dir, from_tf=True).save_pretrained(pt_dir)
+
+        # Export the encoder and both decoders (without and with past key values)
+        onnx_dir = os.path.join(tmp_dir, "onnx")
+        ort_model = ORTModelForSeq2SeqLM.from_pretrained(pt_dir, export=True, use_cache=True, use_merged=False)
+        ort_model.save_pretrained(onnx_dir)
+
+        # Dynamic quantization: int8 weights, activations quantized on the fly
+        quantization_config = getattr(AutoQuantizationConfig, ONNX_QUANTIZATION_TARGET)(is_static=False, per_channel=False)
+        for file_name in ONNX_FILE_NAMES:
+            quantizer = ORTQuantizer.from_pretrained(onnx_dir, file_name=file_name)
+            quantizer.quantize(save_dir=output_dir, quantization_config=quantization_config)
+
+        ort_model.config.save_pretrained(output_dir)
+        tokenizer.save_pretrained(output_dir)
+
+    print(f"✅ Quantized ONNX generator exported to {output_dir}")
+    return output_dir
+
+def create_onnx_generate_model(model_dir=ONNX_GENERATE_MODEL_PATH, weights_path=None):
+    from optimum.onnxruntime import ORTModelForSeq2SeqLM
+
+    weights_path = weights_path or get_generate_weights_path()
+    export_dir = os.path.join(model_dir, export_dir_name(weights_path))
+    if not os.path.isdir(export_dir):
+        # Several processes may start at once: one exports while the others wait for its lock,
+        # and the export only appears under its final name once complete
+        with file_lock(os.path.join(model_dir, ".export.lock")):
+            if not os.path.isdir(export_dir):
+                tmp_dir = tempfile.mkdtemp(dir=model_dir, prefix=".export-")
+                try:
+                    export_onnx_generate_model(tmp_dir, weights_path)
+                    os.replace(tmp_dir, export_dir)
+                except BaseException:
+                    shutil.rmtree(tmp_dir, ignore_errors=True)
+                    raise
+                remove_old_exports(model_dir, keep=export_dir)
+
+    encoder, decoder, decoder_with_past = [quantized_file_name(file_name) for file_name in ONNX_FILE_NAMES]
+    return ORTModelForSeq2SeqLM.from_pretrained(export_dir,
+                                                encoder_file_name=encoder,
+                                                decoder_file_name=decoder,
+                                                decoder_with_past_file_name=decoder_with_past,
+                                                use_cache=True)
+
+def remove_old_exports(model_dir, keep):
+    """Removes the exports of previous weights, and the leftovers of interrupted exports"""
+    for name in os.listdir(model_dir):
+        path = os.path.join(model_dir, name)
+        if path != keep and os.path.isdir(path) and name.startswith((EXPORT_PREFIX, ".export-")):
+            shutil.rmtree(path, ignore_errors=True)
+
+def time_generation(model, tokenizer, context, n_questions, runs=3):
+    """Returns the generated questions and the median latency over `runs` calls, after one warm-up call"""
+    questions = generate_questions(model, tokenizer, context, n_questions)
+    latencies = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        generate_questions(model, tokenizer, context, n_questions)
+        latencies.append(time.perf_counter() - start)
+    return questions, statistics.median(latencies)
+
+def compare_backends(context=test_context, n_questions=10, runs=3):
+    """Parity harness: generates questions with the TF and the ONNX backends on the same context
+    and reports matching questions, latency and the RSS added by loading each model"""
+    tokenizer = create_generate_tokenizer()
+
+    rss = get_rss_mb()
+    tf_model = create_tf_generate_model()
+    tf_rss = get_rss_mb() - rss
+    tf_questions, tf_latency = time_generation(tf_model, tokenizer, context, n_questions, runs)
+
+    rss = get_rss_mb()
+    onnx_model = create_onnx_generate_model()
+    onnx_rss = get_rss_mb() - rss
+    onnx_questions, onnx_latency = time_generation(onnx_model, tokenizer, context, n_questions, runs)
+
+    matches = sum(tf_q == onnx_q for tf_q, onnx_q in zip(tf_questions, onnx_questions))
+    shared = len(set(tf_questions) & set(onnx_questions))
+    return {"n_questions": n_questions,
+            "exact_position_matches": matches,
+            "shared_questions": shared,
+            "tf_latency_s": tf_latency,
+            "onnx_latency_s": onnx_latency,
+            "speedup": tf_latency / onnx_latency,
+            "tf_rss_mb": tf_rss,
+            "onnx_rss_mb": onnx_rss,
+            "tf_questions": tf_questions,
+            "onnx_questions": onnx_questions}
+
+if __name__ == "__main__":
+    report = compare_backends()
+
+    for tf_q, onnx_q in zip(report["tf_questions"], report["onnx_questions"]):
+        print(f"{'=' if tf_q == onnx_q else '≠'} TF:   {tf_q}\n  ONNX: {onnx_q}")
+    print(f"\nSame question at the same position: {report['exact_position_matches']}/{report['n_questions']}")
+    print(f"Questions generated by both: {report['shared_questions']}/{report['n_questions']}")
+    print(f"Median latency: TF {report['tf_latency_s']:.2f}s, ONNX {report['onnx_latency_s']:.2f}s ({report['speedup']:.1f}x)")
+    print(f"RSS added by loading: TF {report['tf_rss_mb']:.0f} MB, ONNX {report['onnx_rss_mb']:.0f} MB")
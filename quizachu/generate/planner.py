@@ -0,0 +1,110 @@
+from quizachu.params import *
+from typing import NamedTuple, Optional
+
+import threading
+
+
+class GenerationPlan(NamedTuple):
+    """How `model.generate` is configured to produce `n_questions` questions per context"""
+    n_questions: int
+    num_beams: int
+    num_beam_groups: int
+    do_sample: bool = False
+    max_new_tokens: Optional[int] = None
+
+    @property
+    def mode(self):
+        return "sample" if self.do_sample else "beam"
+
+    def generate_kwargs(self):
+        kwargs = {"num_return_sequences": self.n_questions,
+                  "no_repeat_ngram_size": 2,
+                  "repetition_penalty": 2.0}
+        if self.do_sample:
+            kwargs.update(do_sample=True, num_beams=1,
+                          top_p=GENERATE_TOP_P, top_k=GENERATE_TOP_K, temperature=TEMPERATURE)
+        else:
+            kwargs.update(do_sample=False, num_beams=self.num_beams, num_beam_groups=self.num_beam_groups)
+            if self.num_beam_groups > 1:
+                kwargs["diversity_penalty"] = 10.0
+        if self.max_new_tokens:
+            kwargs["max_new_tokens"] = self.max_new_tokens
+        return kwargs
+
+def default_plan(n_questions):
+    """Diverse beam search with one beam per group and per question (the original configuration)"""
+    return GenerationPlan(n_questions, num_beams=n_questions, num_beam_groups=n_questions)
+
+
+class GenerationPlanner:
+    """Picks a generation plan that fits a per-request latency budget.
+
+    Candidate plans go from the most to the least expensive: full diverse beam search,
+    beam search with fewer groups, then sampling with extra questions and plain sampling.
+    Sampling is cheap and relies on the QA filter to prune. Decoding is never cut short with
+    `max_new_tokens`, since the QA filter does not catch questions truncated mid-sentence.
+    The first candidate whose estimated cost fits the budget is chosen, or the cheapest one
+    when none does.
+
+    Costs are estimated as encoder work proportional to the context tokens plus decoder work
+    proportional to the decoded sequences, steps and context length, scaled by a per-mode
+    factor that `observe` calibrates from measured generate times.
+    """
+
+    # Number of decoder steps when max_new_tokens is not set (the flan-t5 generation default)
+    DEFAULT_STEPS = 20
+
+    def __init__(self, encoder_ms_per_token=GENERATE_ENCODER_MS_PER_TOKEN,
+                 decoder_ms_per_step=GENERATE_DECODER_MS_PER_STEP, smoothing=0.2):
+        self.encoder_ms_per_token = encoder_ms_per_token
+        self.decoder_ms_per_step = decoder_ms_per_step
+        self.smoothing = smoothing
+        self.scale = {"beam": 1.0, "sample": 1.0}
+        self.lock = threading.Lock()
+
+    def candidates(self, n_questions):
+        plans = [default_plan(n_questions)]
+        # Fewer, larger groups: the beams must split evenly between them, so there is
+        # no such plan when n_questions has no divisor between 2 and n_questions // 2
+        groups = max((d for d in range(2, n_questions // 2 + 1) if n_questions % d == 0), default=None)
+        if groups is not None:
+            plans.append(GenerationPlan(n_questions, num_beams=n_questions, num_beam_groups=groups))
+        # Sampled questions are less diverse, so when affordable generate extra ones for the QA filter to prune
+        oversampled = n_questions + (n_questions + 1) // 2
+        plans += [GenerationPlan(oversampled, num_beams=1, num_beam_groups=1, do_sample=True),
+                  GenerationPlan(n_questions, num_beams=1, num_beam_groups=1, do_sample=True)]
+        return plans
+
+    def raw_cost(self, plan, context_tokens):
+        """Cost of generating for contexts of `context_tokens` tokens, before calibration"""
+        steps = plan.max_new_tokens or self.DEFAULT_STEPS
+        # Beam groups are decoded one after the other, each on its share of the beams
+        overhead = 1 + 0.1 * (plan.num_beam_groups - 1) if not plan.do_sample else 1
+        cost = 0
+        for tokens in context_tokens:
+            cost += self.encoder_ms_per_token * tokens
+            cost += self.decoder_ms_per_step * plan.n_questions * steps * (1 + tokens / 512) * overhead
+        return cost
+
+    def estimate(self, plan, context_tokens):
+        return self.scale[plan.mode] * self.raw_cost(plan, context_tokens)
+
+    def plan(self, n_questions, context_tokens, latency_budget_ms=None):
+        """Returns the chosen plan and its estimated cost in ms"""
+        candidates = self.candidates(n_questions)
+        if latency_budget_ms is None:
+            return candidates[0], self.estimate(candidates[0], context_tokens)
+
+        estimates = [self.estimate(plan, context_tokens) for plan in candidates]
+        for plan, estimate in zip(candidates, estimates):
+            if estimate <= latency_budget_ms:
+                return plan, estimate
+        return candidates[-1], estimates[-1]
+
+    def observe(self, plan, context_tokens, measured_ms):
+        """Updates the calibration of `plan.mode` with a measured generate time"""
+        raw = self.raw_cost(plan, context_tokens)
+        if raw <= 0:
+            return
+        with self.lock:
+            self.scale[plan.mode] += self.smoothing * (measured_ms / raw - self.scale[plan.mode])
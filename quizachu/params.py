@@ -1,10 +1,95 @@
 import os
 
 MODELS_BUCKET = os.environ.get("MODELS_BUCKET")
+# Where model artifacts are fetched from: "gcs" (MODELS_BUCKET) or "local" (a directory laid out like the bucket)
+MODELS_BACKEND = os.environ.get("MODELS_BACKEND", "gcs")
+MODELS_BACKEND_PATH = os.environ.get("MODELS_BACKEND_PATH")
+if MODELS_BACKEND not in ("gcs", "local"):
+    raise ValueError(f"Invalid MODELS_BACKEND {MODELS_BACKEND!r}, expected gcs or local")
+if MODELS_BACKEND == "local" and not MODELS_BACKEND_PATH:
+    raise ValueError("MODELS_BACKEND=local needs MODELS_BACKEND_PATH, the directory to read models from")
+ARTIFACT_CHUNK_SIZE = int(os.environ.get("ARTIFACT_CHUNK_SIZE", 32 * 1024 * 1024))
+ARTIFACT_DOWNLOAD_WORKERS = int(os.environ.get("ARTIFACT_DOWNLOAD_WORKERS", 8))
 
 LOCAL_MODELS_PATH = os.environ.get("LOCAL_MODELS_PATH")
+# Load and warm up every model in the background at startup instead of on first request
+EAGER_MODEL_LOADING = os.environ.get("EAGER_MODEL_LOADING", "false").lower() in ("1", "true", "yes")
 GENERATE_MODEL_WEIGHTS_NAME = "generate-production.h5"
+QA_MODEL_NAME = "deepset/roberta-base-squad2"
 
 GENERATE_TOP_P = 0.92
 GENERATE_TOP_K = 60
 TEMPERATURE = 0.8
+
+# Question generation backend: "tf" (TFT5ForConditionalGeneration) or "onnx" (int8 quantized, ONNX Runtime)
+GENERATE_BACKEND = os.environ.get("GENERATE_BACKEND", "tf")
+ONNX_GENERATE_MODEL_PATH = os.environ.get("ONNX_GENERATE_MODEL_PATH",
+                                          os.path.join(LOCAL_MODELS_PATH or ".", "generate-onnx-int8"))
+# Instruction set targeted by dynamic quantization: "avx2", "avx512", "avx512_vnni" or "arm64"
+ONNX_QUANTIZATION_TARGET = os.environ.get("ONNX_QUANTIZATION_TARGET", "avx2")
+
+# Initial cost model of the generation planner, calibrated at runtime from measured generate times
+GENERATE_ENCODER_MS_PER_TOKEN = float(os.environ.get("GENERATE_ENCODER_MS_PER_TOKEN", 0.05))
+GENERATE_DECODER_MS_PER_STEP = float(os.environ.get("GENERATE_DECODER_MS_PER_STEP", 2.0))
+
+# Token window of the flan-t5 encoder (including the end of sequence token)
+GENERATE_MAX_INPUT_TOKENS = int(os.environ.get("GENERATE_MAX_INPUT_TOKENS", 512))
+# Minimum number of tokens shared by consecutive chunks of a context longer than the window
+GENERATE_CHUNK_OVERLAP = int(os.environ.get("GENERATE_CHUNK_OVERLAP", 64))
+
+# Maximum number of contexts passed to a single batched `model.generate` call
+GENERATE_BATCH_SIZE = int(os.environ.get("GENERATE_BATCH_SIZE", 8))
+
+# Maximum number of (question, context) pairs passed through the QA model per forward pass
+QA_BATCH_SIZE = int(os.environ.get("QA_BATCH_SIZE", 16))
+
+# Suppress generated questions that paraphrase one already kept before answering them
+QUESTION_DEDUP_ENABLED = os.environ.get("QUESTION_DEDUP_ENABLED", "false").lower() in ("1", "true", "yes")
+# Two questions with the same numbers are duplicates when the cosine similarity of their hashed
+# n-gram embeddings and the Jaccard overlap of their content words reach these thresholds
+QUESTION_DEDUP_THRESHOLD = float(os.environ.get("QUESTION_DEDUP_THRESHOLD", 0.85))
+QUESTION_DEDUP_MIN_OVERLAP = float(os.environ.get("QUESTION_DEDUP_MIN_OVERLAP", 0.5))
+
+# Number of answer pairs tokenized and predicted together by the score model
+SCORE_BATCH_SIZE = int(os.environ.get("SCORE_BATCH_SIZE", 32))
+# Lengths the score model's input batches are padded to (the smallest fitting the longest pair of
+# a batch), the largest being the score model's input length (128). Only used when the model gives
+# the same predictions at every length, see `quizachu.score.model.fit_length_buckets`
+SCORE_LENGTH_BUCKETS = sorted(int(length) for length in os.environ.get("SCORE_LENGTH_BUCKETS", "32,64,128").split(","))
+# "keras" scores answers with score_model_basic.h5, "shared_encoder" with a small head on the QA model's encoder
+SCORE_BACKEND = os.environ.get("SCORE_BACKEND", "keras")
+SCORE_HEAD_PATH = os.environ.get("SCORE_HEAD_PATH", os.path.join(LOCAL_MODELS_PATH or ".", "score_model", "shared_encoder_head.npz"))
+
+# Long contexts: chunks generated per step while the previous step's questions are answered,
+# and number of generated steps that may wait for the QA model. 0 (the default) splits the chunks
+# in at least two groups of at most GENERATE_BATCH_SIZE given more than one CPU, see
+# `quizachu.chunking.pipeline_chunk_group`
+PIPELINE_CHUNK_GROUP = int(os.environ.get("PIPELINE_CHUNK_GROUP", 0))
+PIPELINE_QUEUE_SIZE = int(os.environ.get("PIPELINE_QUEUE_SIZE", 2))
+
+# Long contexts: when to stop generating and answering chunks once enough good questions are selected
+# ("exhaustive" processes every chunk, "full" stops once n questions are selected, "confident" once
+# they all have a confidence of at least EARLY_STOP_MIN_CONFIDENCE)
+EARLY_STOP_POLICIES = ("exhaustive", "full", "confident")
+EARLY_STOP_POLICY = os.environ.get("EARLY_STOP_POLICY", "exhaustive").lower()
+if EARLY_STOP_POLICY not in EARLY_STOP_POLICIES:
+    raise ValueError(f"Invalid EARLY_STOP_POLICY {EARLY_STOP_POLICY!r}, expected one of {', '.join(EARLY_STOP_POLICIES)}")
+EARLY_STOP_MIN_CONFIDENCE = float(os.environ.get("EARLY_STOP_MIN_CONFIDENCE", 0.5))
+
+# Cross-request batching of model work in the API
+SCHEDULER_MAX_WAIT_MS = float(os.environ.get("SCHEDULER_MAX_WAIT_MS", 10))
+SCHEDULER_MAX_BATCH_SIZE = int(os.environ.get("SCHEDULER_MAX_BATCH_SIZE", 32))
+
+# Result cache for generated questions and answers
+CACHE_ENABLED = os.environ.get("CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+CACHE_MAX_BYTES = int(os.environ.get("CACHE_MAX_BYTES", 64 * 1024 * 1024))
+CACHE_DIR = os.environ.get("CACHE_DIR")
+
+# Add a Server-Timing header with the time spent in each stage to (non-streaming) API responses
+SERVER_TIMING = os.environ.get("SERVER_TIMING", "false").lower() in ("1", "true", "yes")
+
+# Context sessions: documents uploaded once to /contexts and referenced by id afterwards
+CONTEXT_SESSION_TTL_S = float(os.environ.get("CONTEXT_SESSION_TTL_S", 3600))
+CONTEXT_SESSION_MAX = int(os.environ.get("CONTEXT_SESSION_MAX", 256))
+# Answered questions kept per session, the least recently used are dropped first
+CONTEXT_SESSION_MAX_ANSWERS = int(os.environ.get("CONTEXT_SESSION_MAX_ANSWERS", 1024))
@@ -1,51 +1,262 @@
 from quizachu.params import *
-from google.cloud import storage
+from quizachu.utils import file_lock
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+from typing import NamedTuple
 
-def get_generate_weights_path():
+import base64
+import hashlib
+import json
+import os
+import tempfile
+import threading
 
-    path = Path(LOCAL_MODELS_PATH + "/" + GENERATE_MODEL_WEIGHTS_NAME)
-    if path.is_file():
-        return str(path)
 
-    print(f"\nLoad latest model from GCS...")
+class ArtifactInfo(NamedTuple):
+    """A model file in the artifact backend. `generation` changes whenever the file is replaced."""
+    name: str
+    generation: str
+    size: int
+    md5: str
 
-    client = storage.Client()
-    blobs = list(client.get_bucket(MODELS_BUCKET).list_blobs(prefix="generate"))
-    print(blobs)
+def file_md5(path, block_size=8 * 1024 * 1024):
+    md5 = hashlib.md5()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            md5.update(block)
+    return md5.hexdigest()
 
-    try:
-        latest_blob = max(blobs, key=lambda x: x.updated)
-        weights_local_path = os.path.join(LOCAL_MODELS_PATH, latest_blob.name)
-        latest_blob.download_to_filename(weights_local_path)
 
-        print("✅ Latest weights retrieved from cloud storage, path returned")
+class GCSBackend:
+    """Reads model artifacts from a Google Cloud Storage bucket"""
 
-        return weights_local_path
-    except:
-        print(f"\n❌ No model found in GCS bucket {MODELS_BUCKET}")
+    def __init__(self, bucket_name):
+        self.bucket_name = bucket_name
+        self._bucket = None
 
-        return None
+    @property
+    def bucket(self):
+        if self._bucket is None:
+            from google.cloud import storage
+            self._bucket = storage.Client().bucket(self.bucket_name)
+        return self._bucket
 
-def get_scoring_model_path():
-    path = Path(LOCAL_MODELS_PATH + "/score_model/score_model_basic.h5")
-    if path.is_file():
-        return path
+    def latest(self, prefix):
+        blobs = list(self.bucket.list_blobs(prefix=prefix))
+        if not blobs:
+            return None
+        blob = max(blobs, key=lambda x: x.updated)
+        md5 = base64.b64decode(blob.md5_hash).hex() if blob.md5_hash else None
+        return ArtifactInfo(blob.name, str(blob.generation), blob.size, md5)
+
+    def read_range(self, info, start, end):
+        # Pin the generation so that every range comes from the same version of the file
+        blob = self.bucket.blob(info.name, generation=int(info.generation))
+        return blob.download_as_bytes(start=start, end=end - 1)
+
+
+class LocalDirectoryBackend:
+    """Reads model artifacts from a local directory laid out like the bucket (e.g. for tests)"""
+
+    def __init__(self, root):
+        self.root = Path(root)
+
+    def latest(self, prefix):
+        files = [path for path in self.root.rglob("*")
+                 if path.is_file() and path.relative_to(self.root).as_posix().startswith(prefix)]
+        if not files:
+            return None
+        path = max(files, key=lambda x: x.stat().st_mtime_ns)
+        stat = path.stat()
+        return ArtifactInfo(path.relative_to(self.root).as_posix(), str(stat.st_mtime_ns), stat.st_size, file_md5(path))
+
+    def read_range(self, info, start, end):
+        with open(self.root / info.name, "rb") as f:
+            f.seek(start)
+            return f.read(end - start)
+
+
+class ArtifactStore:
+    """Keeps verified local copies of the latest model artifacts.
+
+    Args:
+        backend: Where artifacts come from (`GCSBackend` or `LocalDirectoryBackend`),
+            or None to only serve files already present locally.
+        local_dir: Local cache directory. It holds the artifacts under their backend
+            name and a `manifest.json` recording name, generation and md5 of each.
+        chunk_size: Size of the byte ranges downloaded in parallel.
+        max_workers: Number of concurrent range downloads.
+
+    Downloads go to a temporary file that is checked against the expected md5 before
+    being renamed into place, so a partial or corrupt file is never served. A local copy
+    is reused only while its generation matches the latest one in the backend.
+    """
+
+    def __init__(self, backend, local_dir, chunk_size=32 * 1024 * 1024, max_workers=8):
+        self.backend = backend
+        self.local_dir = Path(local_dir)
+        self.manifest_path = self.local_dir / "manifest.json"
+        self.chunk_size = chunk_size
+        self.max_workers = max_workers
+        self.lock = threading.Lock()
+        self.prefix_locks = {}
+        # Files already hashed by this process, keyed on (path, size, mtime)
+        self.verified = set()
+
+    def fetch(self, prefix):
+        """Returns the local path of the latest artifact under `prefix`, or None if there is none"""
+        with self.lock:
+            prefix_lock = self.prefix_locks.setdefault(prefix, threading.Lock())
+
+        with prefix_lock:
+            entry = self.read_manifest().get(prefix)
+
+            try:
+                info = self.backend.latest(prefix) if self.backend else None
+            except Exception as e:
+                print(f"\n❌ Could not reach the model store for {prefix}: {e!r}")
+                info = None
 
-    print(f"\nLoad latest model from GCS...")
+            if info is None:
+                # Nothing newer can be checked, serve the local copy only if it is intact
+                if entry and self.verify(entry):
+                    return str(self.local_dir / entry["name"])
+                print(f"\n❌ No model found for {prefix}")
+                return None
 
-    client = storage.Client()
-    blobs = list(client.get_bucket(MODELS_BUCKET).list_blobs(prefix="score_model/score_model_basic.h5"))
+            if entry and entry["name"] == info.name and entry["generation"] == info.generation and self.verify(entry):
+                return str(self.local_dir / entry["name"])
 
-    try:
-        latest_blob = max(blobs, key=lambda x: x.updated)
-        weights_local_path = os.path.join(LOCAL_MODELS_PATH, latest_blob.name)
-        latest_blob.download_to_filename(weights_local_path)
+            print(f"\nLoad latest model {info.name} (generation {info.generation})...")
+            try:
+                downloaded = self.download(info)
+            except Exception as e:
+                # Keep serving the previous version rather than failing to start
+                if entry and self.verify(entry):
+                    print(f"\n❌ Could not download {info.name}: {e!r}, serving the local copy (generation {entry['generation']})")
+                    return str(self.local_dir / entry["name"])
+                raise
+            entry = downloaded
+            self.update_manifest(prefix, entry)
+            print("✅ Latest model retrieved from the model store, path returned")
+            return str(self.local_dir / entry["name"])
 
-        print("✅ Latest model retrieved from cloud storage, path returned")
+    def download(self, info):
+        path = self.local_dir / info.name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".part")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.truncate(info.size)
 
-        return weights_local_path
-    except:
-        print(f"\n❌ No model found in GCS bucket {MODELS_BUCKET}")
+            def download_range(start):
+                end = min(start + self.chunk_size, info.size)
+                data = self.backend.read_range(info, start, end)
+                if len(data) != end - start:
+                    raise IOError(f"Expected {end - start} bytes of {info.name} at {start}, got {len(data)}")
+                with open(tmp_path, "r+b") as f:
+                    f.seek(start)
+                    f.write(data)
 
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                list(executor.map(download_range, range(0, info.size, self.chunk_size)))
+
+            md5 = file_md5(tmp_path)
+            if info.md5 and md5 != info.md5:
+                raise IOError(f"Checksum mismatch for {info.name}: expected {info.md5}, got {md5}")
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+        self.mark_verified(path)
+        return {"name": info.name, "generation": info.generation, "size": info.size, "md5": md5}
+
+    def verify(self, entry):
+        path = self.local_dir / entry["name"]
+        try:
+            stat = path.stat()
+        except OSError:
+            return False
+        if stat.st_size != entry["size"]:
+            return False
+        if (str(path), stat.st_size, stat.st_mtime_ns) in self.verified:
+            return True
+        if file_md5(path) != entry["md5"]:
+            print(f"\n❌ Local copy of {entry['name']} is corrupt, it will not be served")
+            return False
+        self.mark_verified(path)
+        return True
+
+    def mark_verified(self, path):
+        stat = Path(path).stat()
+        self.verified.add((str(path), stat.st_size, stat.st_mtime_ns))
+
+    def entry_for_path(self, path):
+        for entry in self.read_manifest().values():
+            if Path(path) == self.local_dir / entry["name"]:
+                return entry
         return None
+
+    def read_manifest(self):
+        try:
+            return json.loads(self.manifest_path.read_text())
+        except (OSError, ValueError):
+            return {}
+
+    def update_manifest(self, prefix, entry):
+        # Several processes (e.g. uvicorn workers) may fetch models at the same time,
+        # so the read-modify-write of the manifest holds a file lock as well
+        with self.lock, file_lock(self.local_dir / ".manifest.lock"):
+            manifest = self.read_manifest()
+            manifest[prefix] = entry
+            self.local_dir.mkdir(parents=True, exist_ok=True)
+            # Write then rename, so a crash never leaves a half-written manifest
+            fd, tmp_path = tempfile.mkstemp(dir=self.local_dir, prefix=".manifest.", suffix=".tmp")
+            with os.fdopen(fd, "w") as f:
+                json.dump(manifest, f, indent=2)
+            os.replace(tmp_path, self.manifest_path)
+
+
+_artifact_store = None
+
+def get_artifact_store():
+    global _artifact_store
+    if _artifact_store is None:
+        if MODELS_BACKEND == "local":
+            backend = LocalDirectoryBackend(MODELS_BACKEND_PATH)
+        elif MODELS_BUCKET:
+            backend = GCSBackend(MODELS_BUCKET)
+        else:
+            backend = None
+        _artifact_store = ArtifactStore(backend, LOCAL_MODELS_PATH,
+                                        chunk_size=ARTIFACT_CHUNK_SIZE,
+                                        max_workers=ARTIFACT_DOWNLOAD_WORKERS)
+    return _artifact_store
+
+def get_model_id(path):
+    """Identifies a local model file, so that results computed with older weights are not reused
+    Uses the manifest checksum when the file came from the artifact store, otherwise its size and mtime"""
+    entry = get_artifact_store().entry_for_path(path)
+    if entry:
+        return f"{entry['name']}#{entry['generation']}:{entry['md5']}"
+    stat = Path(path).stat()
+    return f"{Path(path).name}:{stat.st_size}:{stat.st_mtime_ns}"
+
+def get_local_model_path(name):
+    # Without a backend, fall back to a file placed in the local cache by hand
+    path = Path(LOCAL_MODELS_PATH) / name
+    return str(path) if path.is_file() else None
+
+def get_generate_weights_path():
+    store = get_artifact_store()
+    if store.backend is None:
+        return get_local_model_path(GENERATE_MODEL_WEIGHTS_NAME)
+    return store.fetch("generate")
+
+def get_scoring_model_path():
+    store = get_artifact_store()
+    if store.backend is None:
+        return get_local_model_path("score_model/score_model_basic.h5")
+    return store.fetch("score_model/score_model_basic.h5")
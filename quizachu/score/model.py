@@ -1,7 +1,10 @@
 from quizachu.registry import *
-from quizachu.score.tokenizer import BertSemanticDataTokenizer
-import tensorflow as tf
-import numpy as np
+from quizachu.score.tokenizer import create_score_tokenizer, encode_sentence_pairs
+from quizachu.lazy import lazy_import
+import threading
+
+tf = lazy_import("tensorflow")
+np = lazy_import("numpy")
 
 sentence1 = "A soccer game with multiple males playing"
 sentence2 = "Some men are playing a sport"
@@ -28,21 +31,140 @@ def create_generate_score_model():
     model = tf.keras.saving.load_model(model_path)
     return model
 
-def check_answer_similarity(model, sentence1, sentence2):
-    labels = ["contradiction", "entailment", "neutral"]
-    sentence_pairs = np.array([[str(sentence1), str(sentence2)]])
+# Pairs of different lengths, on which predictions must not depend on the padded length
+LENGTH_CHECK_PAIRS = [(sentence1, sentence2),
+                      ("1815", "The Kingdom of the Netherlands was founded in 1815 after the defeat of Napoleon"),
+                      ("Frisians", "Low Saxons")]
+
+def fit_length_buckets(model, tokenizer, length_buckets=SCORE_LENGTH_BUCKETS, atol=1e-4):
+    """Returns the score model to use and the lengths its input batches can be padded to
+
+    The saved model only takes inputs of its own length, which must be the largest bucket, so
+    it is called on inputs of any length to get a model sharing its weights. A model that pools
+    over padding tokens predicts differently at each length, so the buckets are only used if
+    predictions on a few pairs are the same at every length. Otherwise batches are padded to the
+    model's input length as before."""
+    max_length = max(length_buckets)
+    model_length = model.inputs[0].shape[1]
+    if model_length is not None and max_length != model_length:
+        print(f"❌ The largest of the score length buckets ({max_length}) must be the score model's input length, "
+              f"padding to {model_length}")
+        return model, [model_length]
+    if len(length_buckets) == 1:
+        return model, [max_length]
+
+    try:
+        inputs = [tf.keras.Input(shape=(None,), dtype=tensor.dtype) for tensor in model.inputs]
+        dynamic_model = tf.keras.Model(inputs=inputs, outputs=model(inputs))
+        expected = model.predict_on_batch(encode_sentence_pairs(tokenizer, LENGTH_CHECK_PAIRS, [max_length]))
+        for length in sorted(length_buckets)[:-1]:
+            predicted = dynamic_model.predict_on_batch(encode_sentence_pairs(tokenizer, LENGTH_CHECK_PAIRS, [length, max_length]))
+            if not np.allclose(predicted, expected, atol=atol):
+                print(f"❌ Score model predictions change when padded to {length} tokens, padding to {max_length}")
+                return model, [max_length]
+    except Exception as e:
+        print(f"❌ Score model does not take inputs of variable length ({e}), padding to {max_length}")
+        return model, [max_length]
+
+    print(f"✅ Score model batches padded to {', '.join(map(str, sorted(length_buckets)))} tokens")
+    return dynamic_model, sorted(length_buckets)
+
+def check_answer_similarity(model, sentence1, sentence2, tokenizer=None):
+    return check_answers_similarity(model, [(sentence1, sentence2)], tokenizer=tokenizer)[0]
+
+SCORE_LABELS = ["contradiction", "entailment", "neutral"]
+
+def check_answers_similarity(model, sentence_pairs, tokenizer=None, batch_size=SCORE_BATCH_SIZE, length_buckets=None):
+    """Scores a list of (golden answer, user answer) pairs
+    Pairs are tokenized in batches of `batch_size` and predicted one batch at a time
+    Returns a list of prediction/probability dicts, in the same order as `sentence_pairs`"""
+    return format_predictions(predict_answers_similarity(model, sentence_pairs, tokenizer, batch_size, length_buckets))
+
+def predict_answers_similarity(model, sentence_pairs, tokenizer=None, batch_size=SCORE_BATCH_SIZE, length_buckets=None):
+    """Returns the (n_pairs, 3) array of contradiction/entailment/neutral probabilities
+    With several `length_buckets` (from `fit_length_buckets`), pairs are batched with pairs of
+    similar length, so that short pairs are padded to a short bucket"""
+    if len(sentence_pairs) == 0:
+        return np.zeros((0, len(SCORE_LABELS)))
+
+    from quizachu.score.tokenizer import BertSemanticDataTokenizer
+    sentence_pairs = np.array([[str(sentence1), str(sentence2)] for sentence1, sentence2 in sentence_pairs])
+    # Sort by length in characters, a good enough proxy for the length in tokens
+    order = np.arange(len(sentence_pairs))
+    if length_buckets is not None and len(length_buckets) > 1:
+        order = np.argsort(np.char.str_len(sentence_pairs).sum(axis=1), kind="stable")
     test_data = BertSemanticDataTokenizer(
-        sentence_pairs, labels=None, batch_size=1, shuffle=False, include_targets=False,
+        sentence_pairs[order], labels=None, batch_size=batch_size, shuffle=False, include_targets=False,
+        tokenizer=tokenizer, length_buckets=length_buckets,
     )
 
-    proba = model.predict(test_data[0])[0]
-    idx = np.argmax(proba)
-    proba = f"{proba[idx]: .2f}%"
-    pred = labels[idx]
-    return {"prediction": pred, "probability": proba}
+    # Iterate over every batch, including the last partial one that `len(test_data)` leaves out
+    n_batches = -(-len(sentence_pairs) // batch_size)
+    proba = np.concatenate([model.predict_on_batch(test_data[i]) for i in range(n_batches)])
+    # Back to the order of `sentence_pairs`
+    restored = np.empty_like(proba)
+    restored[order] = proba
+    return restored
+
+def format_predictions(proba):
+    """Turns an array of class probabilities into prediction/probability dicts"""
+    idx = np.argmax(proba, axis=1)
+    proba = proba[np.arange(len(idx)), idx]
+    return [{"prediction": SCORE_LABELS[i], "probability": f"{p: .2f}%"} for i, p in zip(idx, proba)]
+
+class AnswerScorer:
+    """Holds the score model and its BERT tokenizer for the life of the process.
+
+    Both are loaded on the first call to `load` (or `score`) and reused afterwards,
+    so steady-state scoring only costs a forward pass. Batches of short answer pairs are padded
+    to the shortest of the `length_buckets` the model supports. `load_count` counts how many
+    times the model was actually loaded from disk.
+
+    With the "shared_encoder" backend, answers are scored by a distilled head on the
+    encoder of the question answering model instead (see `quizachu.score.shared_encoder`),
+    so no score model is loaded. `question_answerer` is then a function returning the
+    QA pipeline to share, which is created here when not given.
+    """
+
+    def __init__(self, backend=SCORE_BACKEND, question_answerer=None):
+        self.backend = backend
+        self.question_answerer = question_answerer
+        self.model = None
+        self.tokenizer = None
+        self.length_buckets = None
+        self.load_count = 0
+        self.lock = threading.Lock()
+
+    def load(self):
+        with self.lock:
+            if self.model is None:
+                if self.backend == "shared_encoder":
+                    from quizachu.score.shared_encoder import create_shared_encoder_scorer
+                    if self.question_answerer is not None:
+                        question_answerer = self.question_answerer()
+                    else:
+                        from quizachu.answer.model import create_question_answerer
+                        question_answerer = create_question_answerer()
+                    self.model = create_shared_encoder_scorer(question_answerer)
+                else:
+                    self.tokenizer = create_score_tokenizer()
+                    self.model, self.length_buckets = fit_length_buckets(create_generate_score_model(), self.tokenizer)
+                self.load_count += 1
+                print(f"✅ Score model loaded ({self.backend} backend, load #{self.load_count})")
+        return self
+
+    def score(self, sentence1, sentence2):
+        return self.score_pairs([(sentence1, sentence2)])[0]
+
+    def score_pairs(self, sentence_pairs):
+        self.load()
+        if self.backend == "shared_encoder":
+            return self.model.score_pairs(sentence_pairs)
+        return check_answers_similarity(self.model, sentence_pairs, tokenizer=self.tokenizer,
+                                        length_buckets=self.length_buckets)
 
 if __name__ == "__main__":
-    model = create_generate_score_model()
+    scorer = AnswerScorer()
 
-    results = check_answer_similarity(model, sentence1, sentence2)
+    results = scorer.score(sentence1, sentence2)
     print(results)
@@ -0,0 +1,200 @@
+"""Answer scoring from the encoder of the question answering model
+
+The score model is a BERT cross-encoder of its own, a third large model in every API
+process. This backend instead mean-pools the hidden states of the QA model's RoBERTa
+encoder (already loaded to answer questions) for each answer, and classifies the pair
+features [u, v, |u - v|, u * v] with a softmax head of about ten thousand weights.
+
+The head is distilled from the predictions of score_model_basic.h5 on answer pairs built
+from notebooks/questions_for_training, so it reproduces its labels rather than learning
+from scratch. Train it and compare both scorers with:
+
+    python -m quizachu.score.shared_encoder [--output head.npz] [--max-pairs 3000]
+"""
+from quizachu.params import *
+from quizachu.score.model import SCORE_LABELS, format_predictions
+from pathlib import Path
+
+import numpy as np
+
+QUESTION_ANSWER_PAIRS = Path(__file__).resolve().parents[2] / "notebooks" / "questions_for_training"
+
+
+def get_encoder(question_answerer):
+    """Returns the base transformer of the QA pipeline's model, without its span prediction head"""
+    model = question_answerer.model
+    return getattr(model, model.base_model_prefix)
+
+def encode_sentences(question_answerer, sentences, batch_size=SCORE_BATCH_SIZE, max_length=64):
+    """Returns an (n_sentences, hidden_size) array of mask-aware mean-pooled encoder states"""
+    encoder = get_encoder(question_answerer)
+    tokenizer = question_answerer.tokenizer
+    return_tensors = "tf" if type(encoder).__name__.startswith("TF") else "pt"
+
+    embeddings = []
+    for start in range(0, len(sentences), batch_size):
+        tokens = tokenizer(list(sentences[start:start + batch_size]), padding=True, truncation=True,
+                           max_length=max_length, return_tensors=return_tensors)
+        hidden = encoder(input_ids=tokens["input_ids"], attention_mask=tokens["attention_mask"]).last_hidden_state
+        hidden = hidden.detach().numpy() if hasattr(hidden, "detach") else hidden.numpy()
+        mask = np.asarray(tokens["attention_mask"])[..., None].astype(hidden.dtype)
+        embeddings.append((hidden * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1))
+    return np.concatenate(embeddings) if embeddings else np.zeros((0, encoder.config.hidden_size))
+
+def pair_features(u, v):
+    return np.concatenate([u, v, np.abs(u - v), u * v], axis=1)
+
+def encode_pairs(question_answerer, sentence_pairs):
+    """Returns the pair features of every (sentence1, sentence2) pair
+    Both sides of every pair are encoded in the same batches, each distinct sentence once"""
+    sentence_pairs = [(str(s1), str(s2)) for s1, s2 in sentence_pairs]
+    sentences = list(dict.fromkeys(s for pair in sentence_pairs for s in pair))
+    embeddings = encode_sentences(question_answerer, sentences)
+    index = {sentence: i for i, sentence in enumerate(sentences)}
+    u = embeddings[[index[s1] for s1, _ in sentence_pairs]]
+    v = embeddings[[index[s2] for _, s2 in sentence_pairs]]
+    return pair_features(u, v)
+
+
+class SoftmaxHead:
+    """Multinomial logistic regression over pair features, with standardized inputs"""
+
+    def __init__(self, weights=None, bias=None, mean=None, scale=None):
+        self.weights = weights
+        self.bias = bias
+        self.mean = mean
+        self.scale = scale
+
+    def predict_proba(self, features):
+        return self._softmax((features - self.mean) / self.scale)
+
+    def _softmax(self, x):
+        logits = x @ self.weights + self.bias
+        logits -= logits.max(axis=1, keepdims=True)
+        proba = np.exp(logits)
+        return proba / proba.sum(axis=1, keepdims=True)
+
+    def fit(self, features, targets, epochs=300, learning_rate=0.5, l2=1e-3):
+        """Fits the head to `targets`, an (n, 3) array of teacher probabilities, by full batch gradient descent"""
+        self.mean = features.mean(axis=0)
+        self.scale = features.std(axis=0) + 1e-6
+        x = (features - self.mean) / self.scale
+        self.weights = np.zeros((x.shape[1], targets.shape[1]), dtype=x.dtype)
+        self.bias = np.zeros(targets.shape[1], dtype=x.dtype)
+
+        for _ in range(epochs):
+            gradient = (self._softmax(x) - targets) / len(x)
+            self.weights -= learning_rate * (x.T @ gradient + l2 * self.weights)
+            self.bias -= learning_rate * gradient.sum(axis=0)
+        return self
+
+    def save(self, path):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        np.savez(path, weights=self.weights, bias=self.bias, mean=self.mean, scale=self.scale)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(data["weights"], data["bias"], data["mean"], data["scale"])
+
+
+class SharedEncoderScorer:
+    """Scores answer pairs with a `SoftmaxHead` on the QA pipeline's encoder"""
+
+    def __init__(self, question_answerer, head):
+        self.question_answerer = question_answerer
+        self.head = head
+
+    def predict_proba(self, sentence_pairs):
+        if len(sentence_pairs) == 0:
+            return np.zeros((0, len(SCORE_LABELS)))
+        return self.head.predict_proba(encode_pairs(self.question_answerer, sentence_pairs))
+
+    def score_pairs(self, sentence_pairs):
+        return format_predictions(self.predict_proba(sentence_pairs))
+
+def create_shared_encoder_scorer(question_answerer, head_path=SCORE_HEAD_PATH):
+    if not Path(head_path).is_file():
+        raise FileNotFoundError(f"No score head at {head_path}, train one with `python -m quizachu.score.shared_encoder`")
+    return SharedEncoderScorer(question_answerer, SoftmaxHead.load(head_path))
+
+
+def load_answer_pairs(directory=QUESTION_ANSWER_PAIRS, max_pairs=None, seed=42):
+    """Builds (answer, answer) pairs from the question/answer files: answers given by different people
+    to the same question (mostly agreeing) and answers to other questions on the same article"""
+    import pandas as pd
+    frames = [pd.read_csv(path, sep="\t", encoding="utf-8-sig", encoding_errors="ignore", on_bad_lines="skip")
+              for path in sorted(Path(directory).glob("S*_question_answer_pairs.txt"))]
+    data = pd.concat(frames).dropna(subset=["Question", "Answer"])
+    data["Answer"] = data["Answer"].astype(str).str.strip()
+    data = data[data["Answer"] != ""]
+
+    rng = np.random.RandomState(seed)
+    pairs = []
+    for _, answers in data.groupby("Question", sort=False)["Answer"]:
+        answers = list(answers)
+        pairs += [(a, b) for i, a in enumerate(answers) for b in answers[i + 1:]]
+    for _, answers in data.groupby("ArticleTitle", sort=False)["Answer"]:
+        answers = list(answers)
+        if len(answers) > 1:
+            shuffled = rng.permutation(len(answers))
+            pairs += [(answers[i], answers[j]) for i, j in zip(shuffled[::2], shuffled[1::2])]
+
+    pairs = [pairs[i] for i in rng.permutation(len(pairs))]
+    return pairs[:max_pairs] if max_pairs else pairs
+
+def distill_head(question_answerer, sentence_pairs, teacher_proba, **fit_kwargs):
+    """Fits a head on the QA encoder to reproduce the score model's probabilities"""
+    head = SoftmaxHead().fit(encode_pairs(question_answerer, sentence_pairs), teacher_proba, **fit_kwargs)
+    return SharedEncoderScorer(question_answerer, head)
+
+
+if __name__ == "__main__":
+    from quizachu.answer.model import create_question_answerer
+    from quizachu.score.model import AnswerScorer, predict_answers_similarity
+    from quizachu.utils import get_rss_mb
+
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--output", default=SCORE_HEAD_PATH, help="where to save the distilled head")
+    parser.add_argument("--max-pairs", type=int, default=3000)
+    parser.add_argument("--test-fraction", type=float, default=0.2)
+    args = parser.parse_args()
+
+    pairs = load_answer_pairs(max_pairs=args.max_pairs)
+    n_test = int(len(pairs) * args.test_fraction)
+    train_pairs, test_pairs = pairs[n_test:], pairs[:n_test]
+    print(f"{len(train_pairs)} training pairs, {len(test_pairs)} test pairs")
+
+    rss = get_rss_mb()
+    question_answerer = create_question_answerer()
+    print(f"✅ QA model loaded (+{get_rss_mb() - rss:.0f} MB)")
+    rss = get_rss_mb()
+    teacher = AnswerScorer(backend="keras").load()
+    print(f"✅ Score model loaded (+{get_rss_mb() - rss:.0f} MB, saved by the shared encoder backend)")
+
+    teacher_proba = predict_answers_similarity(teacher.model, train_pairs, tokenizer=teacher.tokenizer,
+                                               length_buckets=teacher.length_buckets)
+    student = distill_head(question_answerer, train_pairs, teacher_proba)
+    student.head.save(args.output)
+    print(f"✅ Head saved to {args.output}")
+
+    start = time.perf_counter()
+    expected = predict_answers_similarity(teacher.model, test_pairs, tokenizer=teacher.tokenizer,
+                                          length_buckets=teacher.length_buckets)
+    teacher_time = time.perf_counter() - start
+    start = time.perf_counter()
+    predicted = student.predict_proba(test_pairs)
+    student_time = time.perf_counter() - start
+
+    agreement = (expected.argmax(axis=1) == predicted.argmax(axis=1)).mean()
+    print(f"\nAgreement with score_model_basic.h5 labels: {agreement:.1%}")
+    for i, label in enumerate(SCORE_LABELS):
+        mask = expected.argmax(axis=1) == i
+        if mask.any():
+            print(f"  {label:>13}: {(predicted[mask].argmax(axis=1) == i).mean():.1%} of {mask.sum()}")
+    print(f"Mean absolute probability difference: {np.abs(expected - predicted).mean():.3f}")
+    print(f"Latency per pair: score model {teacher_time / len(test_pairs) * 1000:.2f} ms, "
+          f"shared encoder {student_time / len(test_pairs) * 1000:.2f} ms")
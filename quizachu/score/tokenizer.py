@@ -1,78 +1,127 @@
-import tensorflow as tf
-import numpy as np
-
-class BertSemanticDataTokenizer(tf.keras.utils.Sequence):
-    """Generates batches of data.
-
-    Args:
-        sentence_pairs: Array of premise and hypothesis input sentences.
-        labels: Array of labels.
-        batch_size: Integer batch size.
-        shuffle: boolean, whether to shuffle the data.
-        include_targets: boolean, whether to incude the labels.
-
-    Returns:
-        Tuples `([input_ids, attention_mask, `token_type_ids], labels)`
-        (or just `[input_ids, attention_mask, `token_type_ids]`
-         if `include_targets=False`)
-    """
-
-    def __init__(
-        self,
-        sentence_pairs,
-        labels,
-        batch_size=32,
-        shuffle=True,
-        include_targets=True,
-    ):
-        self.sentence_pairs = sentence_pairs
-        self.labels = labels
-        self.shuffle = shuffle
-        self.batch_size = batch_size
-        self.include_targets = include_targets
-        # Load our BERT Tokenizer to encode the text.
-        # We will use base-base-uncased pretrained model.
-        from transformers import BertTokenizer
-        self.tokenizer = BertTokenizer.from_pretrained(
-            "bert-base-uncased", do_lower_case=True
-        )
-        self.indexes = np.arange(len(self.sentence_pairs))
-        self.on_epoch_end()
-
-    def __len__(self):
-        # Denotes the number of batches per epoch.
-        return len(self.sentence_pairs) // self.batch_size
-
-    def __getitem__(self, idx):
-        # Retrieves the batch of index.
-        indexes = self.indexes[idx * self.batch_size : (idx + 1) * self.batch_size]
-        sentence_pairs = self.sentence_pairs[indexes]
-
-        # With BERT tokenizer's batch_encode_plus batch of both the sentences are
-        # encoded together and separated by [SEP] token.
-        encoded = self.tokenizer.batch_encode_plus(
-            sentence_pairs.tolist(),
-            add_special_tokens=True,
-            max_length=128,
-            return_attention_mask=True,
-            return_token_type_ids=True,
-            pad_to_max_length=True,
-            return_tensors="tf",
-        )
-
-        # Convert batch of encoded features to numpy array.
-        input_ids = np.array(encoded["input_ids"], dtype="int32")
-        attention_masks = np.array(encoded["attention_mask"], dtype="int32")
-        token_type_ids = np.array(encoded["token_type_ids"], dtype="int32")
-
-        # Set to true if data generator is used for training/validation.
-        if self.include_targets:
-            labels = np.array(self.labels[indexes], dtype="int32")
-            return [input_ids, attention_masks, token_type_ids], labels
-        else:
-            return [input_ids, attention_masks, token_type_ids]
-
-    def on_epoch_end(self):
-        # Shuffle indexes after each epoch if shuffle is set to True.
-        if self.shuffle:
-            np.random.RandomState(42).shuffle(self.indexes)
+from quizachu.lazy import lazy_import
+
+import threading
+
+tf = lazy_import("tensorflow")
+np = lazy_import("numpy")
+
+# Input length of the saved score model
+SCORE_MODEL_LENGTH = 128
+
+def create_score_tokenizer():
+    # Load our BERT Tokenizer to encode the text.
+    # We will use base-base-uncased pretrained model, with the fast (Rust) tokenizer.
+    from transformers import BertTokenizerFast
+    return BertTokenizerFast.from_pretrained(
+        "bert-base-uncased", do_lower_case=True
+    )
+
+def encode_sentence_pairs(tokenizer, sentence_pairs, length_buckets=(SCORE_MODEL_LENGTH,)):
+    """Encodes (sentence1, sentence2) pairs, separated by a [SEP] token, for the score model
+
+    The batch is padded to the smallest of `length_buckets` that fits its longest pair, and pairs
+    longer than the largest bucket are truncated, so the model only ever sees a few input shapes.
+    Returns the int32 `input_ids`, `attention_mask` and `token_type_ids` arrays."""
+    max_length = max(length_buckets)
+    encoded = tokenizer(
+        [str(sentence1) for sentence1, _ in sentence_pairs],
+        [str(sentence2) for _, sentence2 in sentence_pairs],
+        add_special_tokens=True,
+        truncation=True,
+        max_length=max_length,
+        padding="longest",
+        return_attention_mask=True,
+        return_token_type_ids=True,
+        return_tensors="np",
+    )
+
+    length = encoded["input_ids"].shape[1]
+    bucket = min((bucket for bucket in length_buckets if bucket >= length), default=max_length)
+    pad_values = {"input_ids": tokenizer.pad_token_id, "attention_mask": 0, "token_type_ids": 0}
+    return [np.pad(encoded[name].astype("int32", copy=False), ((0, 0), (0, bucket - length)),
+                   constant_values=pad_values[name])
+            for name in ("input_ids", "attention_mask", "token_type_ids")]
+
+def make_bert_semantic_data_tokenizer():
+    class BertSemanticDataTokenizer(tf.keras.utils.Sequence):
+        """Generates batches of data.
+
+        Args:
+            sentence_pairs: Array of premise and hypothesis input sentences.
+            labels: Array of labels.
+            batch_size: Integer batch size.
+            shuffle: boolean, whether to shuffle the data.
+            include_targets: boolean, whether to incude the labels.
+            tokenizer: Optional BERT tokenizer to share between instances
+                (loaded with `create_score_tokenizer` when not given).
+            length_buckets: Lengths batches may be padded to (see `encode_sentence_pairs`).
+                Defaults to SCORE_MODEL_LENGTH only, the fixed input length of the saved
+                score model.
+
+        Returns:
+            Tuples `([input_ids, attention_mask, `token_type_ids], labels)`
+            (or just `[input_ids, attention_mask, `token_type_ids]`
+             if `include_targets=False`)
+        """
+
+        def __init__(
+            self,
+            sentence_pairs,
+            labels,
+            batch_size=32,
+            shuffle=True,
+            include_targets=True,
+            tokenizer=None,
+            length_buckets=None,
+        ):
+            self.sentence_pairs = sentence_pairs
+            self.labels = labels
+            self.shuffle = shuffle
+            self.batch_size = batch_size
+            self.include_targets = include_targets
+            self.tokenizer = tokenizer if tokenizer is not None else create_score_tokenizer()
+            self.length_buckets = length_buckets or (SCORE_MODEL_LENGTH,)
+            self.indexes = np.arange(len(self.sentence_pairs))
+            self.on_epoch_end()
+
+        def __len__(self):
+            # Denotes the number of batches per epoch.
+            return len(self.sentence_pairs) // self.batch_size
+
+        def __getitem__(self, idx):
+            # Retrieves the batch of index.
+            indexes = self.indexes[idx * self.batch_size : (idx + 1) * self.batch_size]
+            sentence_pairs = self.sentence_pairs[indexes]
+
+            # Both sentences of each pair are encoded together, separated by [SEP] token,
+            # straight to numpy arrays padded to the batch's length bucket.
+            input_ids, attention_masks, token_type_ids = encode_sentence_pairs(
+                self.tokenizer, sentence_pairs.tolist(), self.length_buckets
+            )
+
+            # Set to true if data generator is used for training/validation.
+            if self.include_targets:
+                labels = np.array(self.labels[indexes], dtype="int32")
+                return [input_ids, attention_masks, token_type_ids], labels
+            else:
+                return [input_ids, attention_masks, token_type_ids]
+
+        def on_epoch_end(self):
+            # Shuffle indexes after each epoch if shuffle is set to True.
+            if self.shuffle:
+                np.random.RandomState(42).shuffle(self.indexes)
+
+    BertSemanticDataTokenizer.__qualname__ = "BertSemanticDataTokenizer"
+    return BertSemanticDataTokenizer
+
+_class_lock = threading.Lock()
+
+def __getattr__(name):
+    # The data tokenizer subclasses a Keras class, so it is only defined once it is first used,
+    # which keeps TensorFlow out of the import of this module
+    if name == "BertSemanticDataTokenizer":
+        with _class_lock:
+            if name not in globals():
+                globals()[name] = make_bert_semantic_data_tokenizer()
+        return globals()[name]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
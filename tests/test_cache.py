@@ -0,0 +1,61 @@
+from quizachu.cache import ResultCache, make_cache_key
+
+import pickle
+
+
+def entry_size(value):
+    return len(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+
+def test_least_recently_used_entries_are_evicted_first():
+    values = {key: key * 100 for key in "abc"}
+    cache = ResultCache(max_bytes=2 * entry_size(values["a"]))
+    cache.set("a", values["a"])
+    cache.set("b", values["b"])
+    # Reading "a" makes "b" the least recently used
+    assert cache.get("a") == values["a"]
+    cache.set("c", values["c"])
+
+    assert cache.get("b") is None
+    assert cache.get("a") == values["a"]
+    assert cache.get("c") == values["c"]
+    stats = cache.stats()
+    assert stats["evictions"] == 1
+    assert stats["entries"] == 2
+    assert stats["bytes"] <= stats["max_bytes"]
+
+def test_values_too_large_for_memory_are_not_kept():
+    cache = ResultCache(max_bytes=10)
+    cache.set("a", "x" * 100)
+    assert cache.get("a") is None
+    assert cache.stats()["entries"] == 0
+
+def test_cached_values_cannot_be_mutated_by_callers():
+    cache = ResultCache()
+    value = ["When was the Netherlands founded?"]
+    cache.set("a", value)
+    value.append("Who founded it?")
+    cache.get("a").append("Who founded it?")
+    assert cache.get("a") == ["When was the Netherlands founded?"]
+
+def test_entries_are_reloaded_from_disk(tmp_path):
+    key = make_cache_key("generate", "model-v1", "The Netherlands was founded in 1815.")
+    cache = ResultCache(directory=tmp_path)
+    cache.set(key, ["When was the Netherlands founded?"])
+
+    # A new process starts with an empty memory tier
+    reloaded = ResultCache(directory=tmp_path)
+    assert reloaded.get(key) == ["When was the Netherlands founded?"]
+    assert reloaded.get(key) == ["When was the Netherlands founded?"]
+    assert reloaded.get("missing") is None
+    stats = reloaded.stats()
+    assert (stats["disk_hits"], stats["hits"], stats["misses"]) == (1, 1, 1)
+
+    # Evicted from memory, still on disk
+    reloaded.clear()
+    assert reloaded.get(key) == ["When was the Netherlands founded?"]
+
+def test_cache_keys_ignore_whitespace_but_not_the_model():
+    key = make_cache_key("generate", "model-v1", "The Netherlands  was\nfounded in 1815.", n=4)
+    assert key == make_cache_key("generate", "model-v1", "The Netherlands was founded in 1815.", n=4)
+    assert key != make_cache_key("generate", "model-v2", "The Netherlands was founded in 1815.", n=4)
+    assert key != make_cache_key("generate", "model-v1", "The Netherlands was founded in 1815.", n=5)
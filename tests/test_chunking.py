@@ -0,0 +1,63 @@
+from quizachu.chunking import chunk_context, coverage_order, pipeline_chunk_group, plan_question_generation
+
+import re
+import pytest
+
+
+class WhitespaceTokenizer:
+    """One token per word, with the offsets of a fast tokenizer"""
+
+    def __call__(self, text, add_special_tokens=False, return_offsets_mapping=False):
+        spans = [match.span() for match in re.finditer(r"\S+", text)]
+        return {"input_ids": list(range(len(spans))), "offset_mapping": spans}
+
+def make_document(n_words):
+    return "  ".join(f"word{i}." for i in range(n_words))
+
+def word_index(token):
+    return int(token[len("word"):-1])
+
+@pytest.mark.parametrize("n_words", [600, 1000, 3000, 5111])
+def test_windows_overlap_and_cover_the_whole_document(n_words):
+    document = make_document(n_words)
+    n_questions, contexts, questions_per_context, context_tokens = plan_question_generation(
+        WhitespaceTokenizer(), document, max_input_tokens=512, overlap=64)
+
+    assert len(contexts) > 1
+    windows = [(word_index(context.split()[0]), word_index(context.split()[-1]) + 1) for context in contexts]
+    assert windows[0][0] == 0
+    assert windows[-1][1] == n_words
+    for (start, end), tokens in zip(windows, context_tokens):
+        # Room is left for the end of sequence token
+        assert end - start == tokens <= 511
+    for (_, previous_end), (start, _) in zip(windows, windows[1:]):
+        assert previous_end - start >= 64
+    # Enough candidates are generated over all the windows
+    assert questions_per_context * len(contexts) >= 4 * n_questions
+
+def test_short_documents_are_not_chunked():
+    document = make_document(300)
+    n_questions, contexts, questions_per_context, context_tokens = plan_question_generation(
+        WhitespaceTokenizer(), document, max_input_tokens=512)
+    assert (n_questions, contexts, questions_per_context, context_tokens) == (6, [document], 24, [300])
+
+def test_chunks_are_exact_slices_of_the_text():
+    document = make_document(100)
+    chunks = chunk_context(WhitespaceTokenizer(), document, width=30, stride=20)
+    assert [(chunk.start_token, chunk.end_token) for chunk in chunks] == [(0, 30), (20, 50), (40, 70), (60, 90), (80, 100)]
+    for chunk in chunks:
+        assert document[chunk.start_char:chunk.end_char] == chunk.text
+        assert chunk.text.startswith(f"word{chunk.start_token}.") and chunk.text.endswith(f"word{chunk.end_token - 1}.")
+
+def test_coverage_order_visits_every_chunk_once():
+    for n_chunks in range(20):
+        order = coverage_order(n_chunks)
+        assert sorted(order) == list(range(n_chunks))
+    assert coverage_order(5) == [0, 4, 2, 1, 3]
+
+def test_pipeline_groups_overlap_generation_with_answering():
+    # Half of the chunks, so that there are at least two groups, and at most a generate batch
+    assert [pipeline_chunk_group(n_chunks, 0, 8, n_cpus=4) for n_chunks in (1, 2, 3, 6, 16, 40)] == [1, 1, 2, 3, 8, 8]
+    # Nothing to overlap on a single CPU
+    assert pipeline_chunk_group(6, 0, 8, n_cpus=1) == 8
+    assert pipeline_chunk_group(6, 2, 8, n_cpus=4) == 2
@@ -0,0 +1,40 @@
+from quizachu.generate.dedup import QuestionDeduplicator, deduplicate_questions
+
+
+def test_distinct_questions_are_kept():
+    pairs = [("When was the Dutch Republic founded?", "When was the Dutch Republic dissolved?"),
+             ("Who founded the company in 1815?", "Who founded the company in 1850?")]
+    for first, second in pairs:
+        assert deduplicate_questions([first, second]) == [first, second]
+
+def test_rephrasings_with_the_same_content_are_dropped():
+    assert deduplicate_questions(["Who founded the company in 1815?", "Who has founded the company in 1815?"]) == \
+        ["Who founded the company in 1815?"]
+
+def test_normalized_duplicates_are_dropped():
+    questions = ["When was the Dutch Republic founded?",
+                 "when was the Dutch republic founded",
+                 "When was the Dutch Republic founded ?",
+                 "Who founded the Dutch Republic?"]
+    assert deduplicate_questions(questions) == [questions[0], questions[3]]
+
+def test_later_calls_compare_with_kept_questions():
+    deduplicator = QuestionDeduplicator()
+    assert deduplicator.add(["Who founded the company in 1815?"]) == ["Who founded the company in 1815?"]
+    assert deduplicator.add(["Who founded the company in 1850?", "Who has founded the company in 1815?"]) == \
+        ["Who founded the company in 1850?"]
+    assert deduplicator.suppressed == 1
+
+def test_synonym_paraphrases_are_dropped():
+    questions = ["When did the Dutch revolt begin?",
+                 "When has the Dutch revolt started?",
+                 "When did the Dutch revolt end?",
+                 "When was the Dutch Republic established?",
+                 "When was the Dutch Republic founded?"]
+    assert deduplicate_questions(questions) == [questions[0], questions[2], questions[3]]
+
+def test_questions_sharing_few_content_words_are_kept():
+    # Similar phrasing, but less than half of their content words in common
+    questions = ["What is the capital of France?", "What is the largest city of France?"]
+    assert deduplicate_questions(questions, threshold=0.0) == questions
+    assert deduplicate_questions(questions, threshold=0.0, min_overlap=0.0) == questions[:1]
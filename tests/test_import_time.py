@@ -0,0 +1,24 @@
+import json
+import subprocess
+import sys
+
+# Frameworks loaded on first use of a model, never by importing the API
+DEFERRED_MODULES = ["tensorflow", "transformers", "pandas", "numpy", "google.cloud.storage"]
+
+CHILD = """
+import json, sys, time
+start = time.perf_counter()
+import quizachu.api.fast
+elapsed = time.perf_counter() - start
+print(json.dumps({{"seconds": elapsed, "loaded": [m for m in {deferred!r} if m in sys.modules]}}))
+"""
+
+
+def test_api_import_defers_model_frameworks():
+    result = subprocess.run([sys.executable, "-c", CHILD.format(deferred=DEFERRED_MODULES)],
+                            capture_output=True, text=True, timeout=120)
+    assert result.returncode == 0, result.stderr[-2000:]
+    measurement = json.loads(result.stdout.strip().splitlines()[-1])
+    assert measurement["loaded"] == []
+    # Generous, to hold on slow CI machines: the point is to catch a framework import (seconds)
+    assert measurement["seconds"] < 10
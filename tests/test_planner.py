@@ -0,0 +1,18 @@
+from quizachu.generate.planner import GenerationPlanner
+
+
+def test_every_candidate_splits_its_beams_evenly():
+    planner = GenerationPlanner()
+    for n_questions in range(1, 17):
+        for plan in planner.candidates(n_questions):
+            kwargs = plan.generate_kwargs()
+            assert kwargs["num_beams"] % kwargs.get("num_beam_groups", 1) == 0, (n_questions, plan)
+            assert kwargs["num_return_sequences"] >= n_questions
+            if not plan.do_sample:
+                assert kwargs["num_return_sequences"] <= kwargs["num_beams"]
+
+def test_fewer_groups_candidate_uses_the_largest_divisor():
+    planner = GenerationPlanner()
+    groups = {n: [plan.num_beam_groups for plan in planner.candidates(n)[1:] if not plan.do_sample]
+              for n in (4, 7, 9, 12)}
+    assert groups == {4: [2], 7: [], 9: [3], 12: [6]}
@@ -0,0 +1,47 @@
+from quizachu.answer.model import RunningTopN, select_top_n_answered_questions
+
+import numpy as np
+import pandas as pd
+import pytest
+
+
+def random_answered_questions(rng, n_rows, n_answers):
+    # Distinct confidences, so that the full sort has a single order
+    confidences = rng.permutation(n_rows) / n_rows
+    return pd.DataFrame({"confidence": confidences,
+                         "question": [f"Question {i}?" for i in range(n_rows)],
+                         "answer": [f"answer {a}" for a in rng.integers(0, n_answers, n_rows)]})
+
+@pytest.mark.parametrize("seed", range(20))
+def test_same_selection_as_a_full_sort(seed):
+    rng = np.random.default_rng(seed)
+    questions_answers = random_answered_questions(rng, n_rows=int(rng.integers(1, 120)), n_answers=int(rng.integers(1, 30)))
+    c, n, max_repeat = 0.3, int(rng.integers(1, 25)), int(rng.integers(1, 4))
+
+    running_top = RunningTopN(c=c, n=n, max_repeat_exact_answers=max_repeat, policy="exhaustive")
+    # Rows arrive in groups of random sizes, as chunks are answered
+    bounds = np.sort(rng.choice(np.arange(1, len(questions_answers)), size=min(5, len(questions_answers) - 1), replace=False))
+    for start, end in zip([0, *bounds], [*bounds, len(questions_answers)]):
+        running_top.add(questions_answers.iloc[start:end])
+
+    expected = select_top_n_answered_questions(questions_answers, c=c, n=n, max_repeat_exact_answers=max_repeat)
+    assert [row["question"] for row in running_top.top] == list(expected["question"])
+    assert running_top.full == (len(expected) == n)
+
+def test_early_stop_policies():
+    questions_answers = pd.DataFrame({"confidence": [0.9, 0.4, 0.8],
+                                      "question": ["Q1?", "Q2?", "Q3?"],
+                                      "answer": ["a", "b", "c"]})
+    done = {}
+    for policy in ("exhaustive", "full", "confident"):
+        running_top = RunningTopN(n=2, policy=policy, min_confidence=0.5)
+        running_top.add(questions_answers.iloc[:2])
+        done[policy] = [running_top.done]
+        running_top.add(questions_answers.iloc[2:])
+        done[policy].append(running_top.done)
+    # After the first group the top 2 are full, but one is below min_confidence
+    assert done == {"exhaustive": [False, False], "full": [True, True], "confident": [False, True]}
+
+def test_unknown_policy_is_rejected():
+    with pytest.raises(ValueError):
+        RunningTopN(policy="greedy")
@@ -0,0 +1,65 @@
+from quizachu.api.scheduler import BatchScheduler
+
+import asyncio
+import time
+
+
+def run_concurrently(scheduler, kind, payloads):
+    async def main():
+        try:
+            return await asyncio.gather(*[scheduler.submit(kind, payload) for payload in payloads],
+                                        return_exceptions=True)
+        finally:
+            scheduler.stop()
+    return asyncio.run(main())
+
+def test_batch_flushes_when_full():
+    batches = []
+    def double(payloads):
+        batches.append(list(payloads))
+        return [payload * 2 for payload in payloads]
+
+    # The wait window is long enough that only the batch size can flush the batches in time
+    scheduler = BatchScheduler({"double": double}, max_wait=30, max_batch_size=3)
+    start = time.monotonic()
+    results = run_concurrently(scheduler, "double", [1, 2, 3, 4, 5, 6])
+    assert time.monotonic() - start < 10
+    assert results == [2, 4, 6, 8, 10, 12]
+    assert batches == [[1, 2, 3], [4, 5, 6]]
+
+def test_batch_flushes_when_the_wait_window_closes():
+    batches = []
+    def double(payloads):
+        batches.append(list(payloads))
+        return [payload * 2 for payload in payloads]
+
+    scheduler = BatchScheduler({"double": double}, max_wait=0.05, max_batch_size=100)
+    results = run_concurrently(scheduler, "double", [1, 2])
+    assert results == [2, 4]
+    assert batches == [[1, 2]]
+
+def test_handler_error_reaches_every_caller_of_the_batch():
+    def fail(payloads):
+        raise RuntimeError(f"batch of {len(payloads)} failed")
+
+    scheduler = BatchScheduler({"fail": fail}, max_wait=0.05, max_batch_size=100)
+    results = run_concurrently(scheduler, "fail", ["a", "b", "c"])
+    assert len(results) == 3
+    for result in results:
+        assert isinstance(result, RuntimeError) and str(result) == "batch of 3 failed"
+
+def test_lanes_batch_each_kind_separately():
+    batches = []
+    def record(payloads):
+        batches.append(list(payloads))
+        return payloads
+
+    scheduler = BatchScheduler({"generate": record, "answer": record}, max_wait=0.05, max_batch_size=100)
+    async def main():
+        try:
+            return await asyncio.gather(scheduler.submit("generate", "g1"), scheduler.submit("answer", "a1"),
+                                        scheduler.submit("generate", "g2"))
+        finally:
+            scheduler.stop()
+    assert asyncio.run(main()) == ["g1", "a1", "g2"]
+    assert sorted(batches) == [["a1"], ["g1", "g2"]]
@@ -0,0 +1,77 @@
+from quizachu.api.singleflight import SingleFlight
+
+import asyncio
+import pytest
+
+
+def test_concurrent_identical_requests_share_one_computation():
+    calls = 0
+
+    async def compute():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return {"questions": ["When was the Netherlands founded?"]}
+
+    async def main():
+        flight = SingleFlight()
+        body = {"context": "The Netherlands was founded  in 1815."}
+        # Same request, with the context's whitespace normalized like the cache key
+        results = await asyncio.gather(flight.run("/generate", body, compute),
+                                       flight.run("/generate", body, compute),
+                                       flight.run("/generate", {"context": "The Netherlands was founded in 1815."}, compute))
+        return flight, results
+
+    flight, results = asyncio.run(main())
+    assert calls == 1
+    assert results == [{"questions": ["When was the Netherlands founded?"]}] * 3
+    # Followers get copies, not the leader's object
+    assert results[0] is not results[1]
+    assert flight.in_flight == {}
+
+def test_different_requests_are_not_coalesced():
+    calls = []
+
+    async def main():
+        flight = SingleFlight()
+
+        def compute(context):
+            async def run():
+                calls.append(context)
+                await asyncio.sleep(0.01)
+                return context
+            return run
+
+        return await asyncio.gather(flight.run("/generate", {"context": "a"}, compute("a")),
+                                    flight.run("/generate", {"context": "b"}, compute("b")),
+                                    flight.run("/answer", {"context": "a"}, compute("a")))
+
+    assert asyncio.run(main()) == ["a", "b", "a"]
+    assert len(calls) == 3
+
+def test_leader_exception_reaches_every_follower():
+    calls = 0
+
+    async def compute():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        raise ValueError("model failed")
+
+    async def main():
+        flight = SingleFlight()
+        results = await asyncio.gather(*[flight.run("/generate", {"context": "a"}, compute) for _ in range(3)],
+                                       return_exceptions=True)
+        return flight, results
+
+    flight, results = asyncio.run(main())
+    assert calls == 1
+    assert len(results) == 3
+    for result in results:
+        assert isinstance(result, ValueError) and str(result) == "model failed"
+    assert flight.in_flight == {}
+
+    # Once done, the next identical request computes again
+    with pytest.raises(ValueError):
+        asyncio.run(flight.run("/generate", {"context": "a"}, compute))
+    assert calls == 2